@@ -1,14 +1,177 @@
 import argparse
 import csv
+from functools import partial
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import yaml
 import numpy as np
-from sklearn.metrics import (f1_score, accuracy_score,
-                            jaccard_score, recall_score, precision_score)
+
+
+def confusion_matrix(labels, preds, num_classes):
+    """Builds the confusion matrix of a video with a single bincount.
+
+    Args:
+        labels (1D-array[int]): The ground-truth labels
+        preds (1D-array[int]): The predictions
+        num_classes (int): The number of classes in the dataset
+
+    Returns:
+        2D-array[np.int64]: The [num_classes, num_classes] confusion matrix. The entry (i, j)
+                            is the number of frames of label i predicted as j.
+
+    Raises:
+        AssertionError: if a label or a prediction is not between 0 and num_classes - 1.
+
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    preds = np.asarray(preds, dtype=np.int64)
+    assert len(labels) == len(preds), "labels and predictions should have the same length"
+    assert not len(labels) or (0 <= min(labels.min(), preds.min()) and max(labels.max(), preds.max()) < num_classes), \
+        f"labels and predictions are supposed to be integers between 0 and {num_classes - 1}"
+
+    return np.bincount(labels * num_classes + preds, minlength=num_classes * num_classes).reshape(num_classes, num_classes)
+
+
+def safe_divide(numerator, denominator):
+    """A util function for element-wise division, where a division by zero gives 0
+    (the scikit-learn 'zero_division' default behaviour).
+    """
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros(np.broadcast(numerator, denominator).shape), where=denominator != 0)
+
+
+def run_length_encode(values):
+    """Encodes a sequence as runs (segments) of equal consecutive values.
+
+    Args:
+        values (1D-array[int]): The sequence.
+
+    Returns:
+        A tuple consisting of:
+            1D-array[np.int64]: The value of each run
+            1D-array[np.int64]: The length of each run
+    """
+    values = np.asarray(values, dtype=np.int64)
+    if not len(values):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], values[1:] != values[:-1]]))
+    lengths = np.diff(np.concatenate([starts, [len(values)]]))
+    return values[starts], lengths
+
+
+def edit_distance(first, second):
+    """Computes the Levenshtein distance between two sequences of segment labels. Each row of
+    the dynamic programming table is computed at once: insertions are resolved with a
+    cumulative minimum, so the cost is O(len(first)) numpy operations of size len(second).
+
+    Args:
+        first (1D-array[int]): The first sequence.
+        second (1D-array[int]): The second sequence.
+
+    Returns:
+        int: The edit distance.
+    """
+    second = np.asarray(second)
+    offsets = np.arange(len(second) + 1)
+    row = offsets.copy()
+    for i, value in enumerate(first, start=1):
+        # deletions and substitutions, from the previous row
+        candidates = np.empty_like(row)
+        candidates[0] = i
+        candidates[1:] = np.minimum(row[1:] + 1, row[:-1] + (second != value))
+        # insertions: row[j] = min over k <= j of candidates[k] + (j - k)
+        row = np.minimum.accumulate(candidates - offsets) + offsets
+    return int(row[-1])
+
+
+def segmental_counts(gt_segments, pred_segments, overlap):
+    """Counts the true positive, false positive, and false negative segments at an IoU threshold:
+    a predicted segment is a true positive if its best overlapping ground-truth segment of the
+    same label has an IoU of at least 'overlap', and was not already matched.
+
+    Args:
+        gt_segments (tuple): The (labels, starts, ends) arrays of the ground-truth segments.
+        pred_segments (tuple): The (labels, starts, ends) arrays of the predicted segments.
+        overlap (float): The IoU threshold (e.g. 0.1, 0.25, 0.5).
+
+    Returns:
+        1D-array[np.int64]: The (TP, FP, FN) counts.
+    """
+    gt_labels, gt_starts, gt_ends = gt_segments
+    pred_labels, pred_starts, pred_ends = pred_segments
+    if not len(gt_labels) or not len(pred_labels):
+        return np.array([0, len(pred_labels), len(gt_labels)], dtype=np.int64)
+
+    intersection = np.minimum(pred_ends[:, None], gt_ends[None]) - np.maximum(pred_starts[:, None], gt_starts[None])
+    union = np.maximum(pred_ends[:, None], gt_ends[None]) - np.minimum(pred_starts[:, None], gt_starts[None])
+    iou = intersection / union * (pred_labels[:, None] == gt_labels[None])
+
+    best = iou.argmax(axis=1)
+    hits = np.zeros(len(gt_labels), dtype=bool)
+    tp = 0
+    for i, j in enumerate(best):
+        if iou[i, j] >= overlap and not hits[j]:
+            tp += 1
+            hits[j] = True
+
+    return np.array([tp, len(pred_labels) - tp, len(gt_labels) - tp], dtype=np.int64)
+
+
+def relaxed_confusion_matrix(gt_runs, pred_runs, tolerance, num_classes):
+    """Builds the confusion matrix of a video with relaxed phase boundaries: during the first
+    'tolerance' frames of a ground-truth segment, predicting the label of the previous segment
+    is considered correct, and during its last 'tolerance' frames, predicting the label of the
+    next segment is considered correct.
+
+    It is computed on the runs only: the video is split into pieces at the runs boundaries and at
+    the tolerance windows edges, each piece having a single ground-truth label, prediction, and
+    window membership.
+
+    Args:
+        gt_runs (tuple): The (values, lengths) runs of the ground-truth labels.
+        pred_runs (tuple): The (values, lengths) runs of the predictions.
+        tolerance (int): The tolerance, in frames.
+        num_classes (int): The number of classes in the dataset
+
+    Returns:
+        2D-array[np.int64]: The [num_classes, num_classes] relaxed confusion matrix.
+    """
+    gt_labels, gt_lengths = gt_runs
+    pred_labels, pred_lengths = pred_runs
+    if not len(gt_labels):
+        return np.zeros((num_classes, num_classes), dtype=np.int64)
+
+    gt_ends = np.cumsum(gt_lengths)
+    gt_starts = gt_ends - gt_lengths
+    pred_ends = np.cumsum(pred_lengths)
+    pred_starts = pred_ends - pred_lengths
+
+    head_ends = np.minimum(gt_starts + tolerance, gt_ends)
+    tail_starts = np.maximum(gt_ends - tolerance, gt_starts)
+    bounds = np.unique(np.concatenate([gt_starts, pred_starts, head_ends, tail_starts, gt_ends[-1:]]))
+    pieces_starts, pieces_lengths = bounds[:-1], np.diff(bounds)
+
+    gt = np.searchsorted(gt_starts, pieces_starts, side="right") - 1
+    preds = pred_labels[np.searchsorted(pred_starts, pieces_starts, side="right") - 1]
+    labels = gt_labels[gt]
+
+    previous_labels = gt_labels[np.maximum(gt - 1, 0)]
+    next_labels = gt_labels[np.minimum(gt + 1, len(gt_labels) - 1)]
+    in_head = (gt > 0) & (pieces_starts < head_ends[gt]) & (preds == previous_labels)
+    in_tail = (gt < len(gt_labels) - 1) & (pieces_starts >= tail_starts[gt]) & (preds == next_labels)
+    preds = np.where(in_head | in_tail, labels, preds)
+
+    return np.bincount(labels * num_classes + preds, weights=pieces_lengths,
+                       minlength=num_classes * num_classes).astype(np.int64).reshape(num_classes, num_classes)
 
 
 class MetricsClass:
-    """Class wrapper for calculating the supported metrics
+    """Class wrapper for calculating the supported metrics from confusion matrices
+    (see 'confusion_matrix'). All metrics accept a single confusion matrix, or a stack of
+    them (e.g. one per video) and then return one value per matrix. They give the same values
+    as the scikit-learn functions with macro-averaging across all the classes.
     
     Args:
         num_classes (int): The number of classes in the dataset
@@ -18,69 +181,270 @@ class MetricsClass:
     def __init__(self, num_classes):
         self.num_classes = num_classes
 
-    def f1_score(self, labels, preds):
-        """Calculates the F1-score metric using scikit-learn library
-        with macro-averaging across classes.
+    def counts(self, cm):
+        """Gets the per-class true positives, false positives, and false negatives.
+
+        Args:
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
+
+        Returns:
+            A tuple of three ND-array[int] of shape [..., num_classes]: (TP, FP, FN)
+        """
+        tp = np.diagonal(cm, axis1=-2, axis2=-1)
+        fp = cm.sum(axis=-2) - tp
+        fn = cm.sum(axis=-1) - tp
+        return tp, fp, fn
+
+    def f1_score(self, cm):
+        """Calculates the F1-score metric with macro-averaging across classes.
     
         Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
 
         Returns:
-            float: the F1-score metric
+            ND-array[float]: the F1-score metric, of shape [...]
         """
-        return f1_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
+        tp, fp, fn = self.counts(cm)
+        return safe_divide(2*tp, 2*tp + fp + fn).mean(axis=-1)
     
-    def precision(self, labels, preds):
-        """Calculates the Precision metric using scikit-learn library
-        with macro-averaging across classes.
+    def precision(self, cm):
+        """Calculates the Precision metric with macro-averaging across classes.
     
         Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
 
         Returns:
-            float: the Precision metric
+            ND-array[float]: the Precision metric, of shape [...]
         """
-        return precision_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
+        tp, fp, fn = self.counts(cm)
+        return safe_divide(tp, tp + fp).mean(axis=-1)
     
-    def jaccard(self, labels, preds):
-        """Calculates the Jaccard-score metric using scikit-learn library
-        with macro-averaging across classes.
+    def jaccard(self, cm):
+        """Calculates the Jaccard-score metric with macro-averaging across classes.
     
         Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
 
         Returns:
-            float: the Jaccard-score metric
+            ND-array[float]: the Jaccard-score metric, of shape [...]
         """
-        return jaccard_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
+        tp, fp, fn = self.counts(cm)
+        return safe_divide(tp, tp + fp + fn).mean(axis=-1)
     
-    def recall(self, labels, preds):
-        """Calculates the Recall metric using scikit-learn library
-        with macro-averaging across classes.
+    def recall(self, cm):
+        """Calculates the Recall metric with macro-averaging across classes.
     
         Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
 
         Returns:
-            float: the Recall metric
+            ND-array[float]: the Recall metric, of shape [...]
         """
-        return recall_score(labels, preds, average='macro', labels=list(range(self.num_classes)))
+        tp, fp, fn = self.counts(cm)
+        return safe_divide(tp, tp + fn).mean(axis=-1)
     
-    def accuracy(self, labels, preds):
-        """Calculates the Accuracy metric using scikit-learn library
+    def accuracy(self, cm):
+        """Calculates the Accuracy metric
+    
+        Args:
+            cm (ND-array[int]): The confusion matrices, of shape [..., num_classes, num_classes]
+
+        Returns:
+            ND-array[float]: the Accuracy metric, of shape [...]
+        """
+        return safe_divide(np.trace(cm, axis1=-2, axis2=-1), cm.sum(axis=(-2, -1)))
+
+    def segmental_f1(self, counts):
+        """Calculates the segmental F1-score at an IoU threshold (see 'segmental_counts').
     
         Args:
-            labels (1D-array[int]): The ground-truth labels
-            preds (1D-array[int]): The predictions
+            counts (ND-array[int]): The (TP, FP, FN) segments counts, of shape [..., 3]
+
+        Returns:
+            ND-array[float]: the segmental F1-score, of shape [...]
+        """
+        tp, fp, fn = counts[..., 0], counts[..., 1], counts[..., 2]
+        return safe_divide(2*tp, 2*tp + fp + fn)
+
+    def edit_score(self, edit):
+        """Calculates the (normalized) edit score: 1 - <edit distance between the ground-truth and the
+        predicted segments labels> / <maximum number of segments of both>.
+    
+        Args:
+            edit (ND-array[float]): The (sum of edit scores, number of videos) pairs, of shape [..., 2]
+
+        Returns:
+            ND-array[float]: the mean edit score, of shape [...]
+        """
+        return safe_divide(edit[..., 0], edit[..., 1])
+
+
+SEGMENTAL_F1_OVERLAPS = [0.1, 0.25, 0.5]
+
+
+def read_predictions_chunks(file, chunk_size):
+    """A generator reading a predictions file in chunks of rows, straight into integer arrays.
+    The file is streamed: at most 'chunk_size' rows are in memory at once. Columnar files
+    ('.npz', with "label" and "prediction" integer arrays) are read at once, then chunked.
+
+    Args:
+        file (Path|str): The predictions csv file (or columnar file).
+        chunk_size (int): The number of rows per chunk.
+
+    Yields:
+        A tuple consisting of:
+            1D-array[np.int64]: The ground-truth labels of the chunk
+            1D-array[np.int64]: The predictions of the chunk
+    """
+    if Path(file).suffix == ".npz":
+        with np.load(file) as data:
+            labels = data["label"].astype(np.int64)
+            preds = data["prediction"].astype(np.int64)
+        for start in range(0, len(labels), chunk_size):
+            yield labels[start:start + chunk_size], preds[start:start + chunk_size]
+        return
+
+    with open(file, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None) # header
+        while True:
+            rows = list(islice(reader, chunk_size))
+            if not rows:
+                break
+            columns = np.array([row[1:3] for row in rows if row]).reshape(-1, 2).astype(np.int64)
+            yield columns[:, 0], columns[:, 1]
+
+
+class PredictionsAccumulator:
+    """Accumulates the sufficient statistics of the predictions of a video, chunk by chunk,
+    so that a video never needs to be loaded at once.
+
+    Args:
+        num_classes (int): The number of classes in the dataset
+
+    """
+
+    def __init__(self, num_classes):
+        self.num_classes = num_classes
+        self.cm = np.zeros((num_classes, num_classes), dtype=np.int64)
+        self.runs = {"labels": ([], []), "preds": ([], [])}
+
+    def update(self, labels, preds):
+        """Folds a chunk of consecutive frames into the statistics.
+
+        Args:
+            labels (1D-array[int]): The ground-truth labels of the chunk
+            preds (1D-array[int]): The predictions of the chunk
+        """
+        self.cm += confusion_matrix(labels, preds, self.num_classes)
+        for key, sequence in [("labels", labels), ("preds", preds)]:
+            values, lengths = self.runs[key]
+            chunk_values, chunk_lengths = run_length_encode(sequence)
+            if len(chunk_values) and values and values[-1][-1] == chunk_values[0]:
+                # the last run of the previous chunk continues in this chunk
+                lengths[-1][-1] += chunk_lengths[0]
+                chunk_values, chunk_lengths = chunk_values[1:], chunk_lengths[1:]
+            if len(chunk_values):
+                values.append(chunk_values)
+                lengths.append(chunk_lengths)
+
+    def segments(self, key):
+        """Gets the runs of the ground-truth labels ("labels") or of the predictions ("preds").
 
         Returns:
-            float: the Accuracy metric
+            A tuple consisting of:
+                1D-array[np.int64]: The value of each run
+                1D-array[np.int64]: The length of each run
         """
-        return accuracy_score(labels, preds)
+        values, lengths = self.runs[key]
+        if not values:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        return np.concatenate(values), np.concatenate(lengths)
+
+    def statistics(self, overlaps, tolerance):
+        """Computes the sufficient statistics of the video. They are summed across videos
+        to get the overall statistics.
+
+        Args:
+            overlaps (List[float]): The IoU thresholds of the segmental F1-scores.
+            tolerance (int): The tolerance of the relaxed metrics, in frames.
+
+        Returns:
+            dict: The statistics of the form:
+                {
+                    "cm": <confusion matrix>,
+                    "relaxed_cm": <relaxed confusion matrix (see 'relaxed_confusion_matrix')>,
+                    "segments@<overlap>": <(TP, FP, FN) segments counts (see 'segmental_counts')>,
+                    "edit": <(edit score, 1)>
+                }
+        """
+        gt_runs = self.segments("labels")
+        pred_runs = self.segments("preds")
+        to_segments = lambda runs: (runs[0], np.cumsum(runs[1]) - runs[1], np.cumsum(runs[1]))
+
+        stats = {
+            "cm": self.cm,
+            "relaxed_cm": relaxed_confusion_matrix(gt_runs, pred_runs, tolerance, self.num_classes),
+        }
+        for overlap in overlaps:
+            stats[f"segments@{overlap}"] = segmental_counts(to_segments(gt_runs), to_segments(pred_runs), overlap)
+
+        num_segments = max(len(gt_runs[0]), len(pred_runs[0]))
+        edit = 1 - edit_distance(pred_runs[0], gt_runs[0]) / num_segments if num_segments else 1.0
+        stats["edit"] = np.array([edit, 1.0])
+        return stats
+
+
+def video_statistics(file, num_classes, chunk_size, overlaps, tolerance):
+    """Streams a predictions file into a 'PredictionsAccumulator' and computes its statistics.
+
+    Args:
+        file (Path|str): The predictions csv file.
+        num_classes (int): The number of classes in the dataset
+        chunk_size (int): The number of rows read at once.
+        overlaps (List[float]): The IoU thresholds of the segmental F1-scores.
+        tolerance (int): The tolerance of the relaxed metrics, in frames.
+
+    Returns:
+        dict: The statistics of the video (see 'PredictionsAccumulator.statistics').
+    """
+    accumulator = PredictionsAccumulator(num_classes)
+    for labels, preds in read_predictions_chunks(file, chunk_size):
+        accumulator.update(labels, preds)
+    return accumulator.statistics(overlaps, tolerance)
+
+
+def bootstrap_weights(num_videos, num_resamples, random_state):
+    """Draws video-level bootstrap resamples: each resample draws 'num_videos' videos with
+    replacement, and is represented by the number of times each video was drawn.
+
+    Args:
+        num_videos (int): The number of videos.
+        num_resamples (int): The number of resamples.
+        random_state (np.random.RandomState): The random generator.
+
+    Returns:
+        2D-array[np.int64]: The [num_resamples, num_videos] draw counts.
+    """
+    indices = random_state.randint(0, num_videos, size=(num_resamples, num_videos))
+    offsets = np.arange(num_resamples)[:, None] * num_videos
+    counts = np.bincount((indices + offsets).ravel(), minlength=num_resamples * num_videos)
+    return counts.reshape(num_resamples, num_videos)
+
+
+def bootstrap_interval(values, confidence):
+    """Computes the percentile confidence interval of bootstrapped values.
+
+    Args:
+        values (1D-array[float]): The metric value of each resample.
+        confidence (float): The confidence level (e.g. 0.95).
+
+    Returns:
+        List[float]: The [lower, upper] bounds.
+    """
+    alpha = (1 - confidence) / 2
+    lower, upper = np.percentile(values, [100 * alpha, 100 * (1 - alpha)])
+    return [float(lower), float(upper)]
 
 
 class Evaluation:
@@ -90,64 +454,131 @@ class Evaluation:
         - the overall metric value across the videos is calculated
         - the video-level mean and standard deviation of the metric
           value across the videos are calculated.
+        - optionally, video-level bootstrap confidence intervals of both
+          are calculated (if 'bootstrap_resamples' is set in the configuration).
 
     Args:
         preds_path (str): predictions location.
         parameters_file (str): yaml file with additional parameters
         output_file (str): location to the results
+        num_workers (int, optional): number of predictions files to process in parallel. Defaults
+                                     to the 'num_workers' parameter of the configuration, or 1.
 
     """
 
-    def __init__(self, preds_path, parameters_file, output_file):
+    def __init__(self, preds_path, parameters_file, output_file, num_workers=None):
         with open(parameters_file, "r") as f:
             self.params = yaml.full_load(f)
 
+        # each metric is computed from one of the sufficient statistics of 'PredictionsAccumulator.statistics'
         metrics_class = MetricsClass(self.params["num_classes"])
         self.available_metrics = {
-            "f1-score": metrics_class.f1_score,
-            "recall": metrics_class.recall,
-            "precision": metrics_class.precision,
-            "jaccard": metrics_class.jaccard,
-            "accuracy": metrics_class.accuracy,
+            "f1-score": ("cm", metrics_class.f1_score),
+            "recall": ("cm", metrics_class.recall),
+            "precision": ("cm", metrics_class.precision),
+            "jaccard": ("cm", metrics_class.jaccard),
+            "accuracy": ("cm", metrics_class.accuracy),
+            "relaxed-f1-score": ("relaxed_cm", metrics_class.f1_score),
+            "relaxed-recall": ("relaxed_cm", metrics_class.recall),
+            "relaxed-precision": ("relaxed_cm", metrics_class.precision),
+            "relaxed-jaccard": ("relaxed_cm", metrics_class.jaccard),
+            "relaxed-accuracy": ("relaxed_cm", metrics_class.accuracy),
+            "edit-score": ("edit", metrics_class.edit_score),
         }
+        for overlap in SEGMENTAL_F1_OVERLAPS:
+            self.available_metrics[f"f1@{round(overlap*100)}"] = (f"segments@{overlap}", metrics_class.segmental_f1)
 
         self.output_file = output_file
         self.preds_path = Path(preds_path)
+        self.num_workers = num_workers or self.params.get("num_workers", 1)
+        self.chunk_size = self.params.get("chunk_size", 65536)
+        # the relaxed metrics tolerance, converted from seconds to frames
+        self.tolerance = round(self.params.get("relaxed_tolerance", 10) * self.params.get("fps", 1))
+        # bootstrap confidence intervals are computed only if a number of resamples is given
+        self.bootstrap_resamples = self.params.get("bootstrap_resamples", 0)
+        self.bootstrap_confidence = self.params.get("bootstrap_confidence", 0.95)
+        self.bootstrap_seed = self.params.get("bootstrap_seed", 0)
     
     def run(self):
-        labels = list()
-        preds = list()
-
-        preds_files = self.preds_path.glob("*.csv")
-        for file in preds_files:
-            labels.append([])
-            preds.append([])
-            with open(file) as f:
-                reader = csv.reader(f)
-                for i, row in enumerate(reader):
-                    if i == 0:
-                        continue
-                    labels[-1].append(int(row[1]))
-                    preds[-1].append(int(row[2]))
-        
+        num_classes = self.params["num_classes"]
+        preds_files = sorted(file for file in self.preds_path.glob("*") if file.suffix in [".csv", ".npz"])
+
+        # videos are streamed in parallel into per-video statistics
+        statistics = partial(video_statistics, num_classes=num_classes, chunk_size=self.chunk_size,
+                             overlaps=SEGMENTAL_F1_OVERLAPS, tolerance=self.tolerance)
+        if self.num_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                videos_stats = list(executor.map(statistics, preds_files))
+        else:
+            videos_stats = list(map(statistics, preds_files))
+
+        # per-video statistics are stacked; the overall ones are their sum
         results = {"overall": {}, "per_video": {}}
 
         for metric_name in self.params["metrics"]:
-            metric = self.available_metrics[metric_name]
-            scores_per_video = []
-            for vid_labels, vid_preds in zip(labels, preds):
-                scores = metric(vid_labels, vid_preds)
-                scores_per_video.append(float(scores))
-            scores = metric(sum(labels, []), sum(preds, []))
-            results["overall"][metric_name] = float(scores)
+            stat_name, metric = self.available_metrics[metric_name]
+            stats = np.stack([video_stats[stat_name] for video_stats in videos_stats])
+            scores_per_video = metric(stats)
+            results["overall"][metric_name] = float(metric(stats.sum(axis=0)))
             results["per_video"][metric_name] = {
                                             "mean": float(np.mean(scores_per_video)),
                                             "std": float(np.std(scores_per_video))
                                             }
 
+        if self.bootstrap_resamples:
+            results["bootstrap"] = self.bootstrap(videos_stats)
+
         with open(self.output_file, "w") as f:
             yaml.dump(results, f)
 
+    def bootstrap(self, videos_stats):
+        """Computes video-level bootstrap confidence intervals of the overall metric values and of
+        the video-level means. A resample only needs the number of times each video was drawn:
+        its overall statistics are the weighted sum of the per-video statistics, and its video-level
+        mean the weighted mean of the per-video metric values, so no frame is processed again.
+
+        Args:
+            videos_stats (List[dict]): The statistics of each video (see 'PredictionsAccumulator.statistics').
+
+        Returns:
+            dict: The confidence intervals of the form:
+                {
+                    "resamples": <number of resamples>,
+                    "confidence": <confidence level>,
+                    <metric name>: {
+                        "overall": [<lower bound>, <upper bound>],
+                        "per_video_mean": [<lower bound>, <upper bound>]
+                    },
+                    ...
+                }
+        """
+        num_videos = len(videos_stats)
+        random_state = np.random.RandomState(self.bootstrap_seed)
+        # resamples are drawn in blocks to bound the memory used by the resampled statistics
+        block_size = 1000
+        weights = [bootstrap_weights(num_videos, min(block_size, self.bootstrap_resamples - start), random_state)
+                   for start in range(0, self.bootstrap_resamples, block_size)]
+
+        results = {"resamples": self.bootstrap_resamples, "confidence": self.bootstrap_confidence}
+        for metric_name in self.params["metrics"]:
+            stat_name, metric = self.available_metrics[metric_name]
+            stats = np.stack([video_stats[stat_name] for video_stats in videos_stats])
+            flat_stats = stats.reshape(num_videos, -1)
+            scores_per_video = metric(stats)
+
+            overall_scores = []
+            mean_scores = []
+            for block_weights in weights:
+                resampled_stats = (block_weights @ flat_stats).reshape((-1,) + stats.shape[1:])
+                overall_scores.append(metric(resampled_stats))
+                mean_scores.append(block_weights @ scores_per_video / num_videos)
+
+            results[metric_name] = {
+                "overall": bootstrap_interval(np.concatenate(overall_scores), self.bootstrap_confidence),
+                "per_video_mean": bootstrap_interval(np.concatenate(mean_scores), self.bootstrap_confidence),
+            }
+
+        return results
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -173,11 +604,19 @@ if __name__ == "__main__":
         required=True,
         help="File containing parameters for evaluation",
     )
+    parser.add_argument(
+        "--num_workers",
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Number of predictions files to process in parallel",
+    )
     args = parser.parse_args()
 
 
     evaluator = Evaluation(args.preds_path,
                                 args.parameters_file,
-                                args.output_file)
+                                args.output_file,
+                                args.num_workers)
                                 
     evaluator.run()
@@ -1,7 +1,8 @@
 """MLCube handler file"""
 
 import typer
-import subprocess
+
+from metrics import Evaluation
 
 
 app = typer.Typer()
@@ -15,18 +16,16 @@ class EvaluateTask(object):
     - labels: location of the original data. Dummy input.
     - parameters_file: yaml file with additional parameters
     - output_file: location to the results
+    - num_workers: number of predictions files to process in parallel (optional)
 
     """
 
     @staticmethod
     def run(
-        preds_path: str, labels: str, parameters_file: str, output_file: str
+        preds_path: str, labels: str, parameters_file: str, output_file: str, num_workers: int = None
     ) -> None:
-        cmd = f"python3 metrics.py --preds_path={preds_path} --parameters_file={parameters_file} --output_file={output_file}"
-        splitted_cmd = cmd.split()
-
-        process = subprocess.Popen(splitted_cmd, cwd=".")
-        process.wait()
+        evaluator = Evaluation(preds_path, parameters_file, output_file, num_workers)
+        evaluator.run()
 
 
 @app.command("evaluate")
@@ -35,8 +34,9 @@ def evaluate(
     labels: str = typer.Option(..., "--labels"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
     output_path: str = typer.Option(..., "--output_path"),
+    num_workers: int = typer.Option(None, "--num_workers"),
 ):
-    EvaluateTask.run(preds_path, labels, parameters_file, output_path)
+    EvaluateTask.run(preds_path, labels, parameters_file, output_path, num_workers)
 
 
 @app.command("dummy")
@@ -0,0 +1,157 @@
+import time
+import yaml
+import argparse
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from dataset import video_dataset
+from models import MultiStageModel
+from features import checkpoint_prefix
+from streaming import OnlinePhaseRecognition
+
+
+class StreamingBenchmark:
+    def __init__(self, data_root,
+                       params_file,
+                       feature_extraction_weights_path,
+                       mstcn_weights_path,
+                       video=None,
+                       realtime=True):
+
+        """Measures the latency of the online phase recognition ('streaming.OnlinePhaseRecognition')
+        by replaying a prepared video at its native fps: frame i is made available at i/fps seconds
+        after the start, and its latency is the time from then until its phase is predicted.
+
+        Args:
+            data_root (str): prepared data location, with the same structure as for 'inference.Inference'.
+            params_file (str): yaml file with additional parameters. 'fps' is the sampling rate the
+                               data was prepared with.
+            feature_extraction_weights_path (str): feature extraction model weights location
+            mstcn_weights_path (str): multi-stage temporal convolutional network weights location
+            video (str, optional): name of the video to replay. Defaults to the first video.
+            realtime (bool): if False, frames are given as fast as possible (measures throughput).
+
+        """
+
+        with open(params_file, "r") as f:
+            self.params = yaml.full_load(f)
+
+        self.data_root = Path(data_root)
+        csv_files = sorted((self.data_root / "data_csv").glob("*"))
+        if video is not None:
+            csv_files = [file for file in csv_files if file.stem == video]
+        assert csv_files, f"No video {video} found in {self.data_root / 'data_csv'}"
+        self.csv_file = csv_files[0]
+
+        feature_extractor = tf.keras.applications.resnet50.ResNet50(include_top=False, pooling='avg', weights=None)
+        feature_extractor.load_weights(checkpoint_prefix(feature_extraction_weights_path))
+
+        mstcn = MultiStageModel(num_stages=self.params["num_stages"],
+                                num_layers=self.params["num_layers"],
+                                num_f_maps=self.params["num_f_maps"],
+                                num_classes=self.params["num_classes"])
+        mstcn.build([None, 2048])
+        mstcn.load_weights(checkpoint_prefix(mstcn_weights_path))
+
+        self.engine = OnlinePhaseRecognition(feature_extractor, mstcn)
+        self.realtime = realtime
+
+    def run(self):
+        """ Replays the video and prints the latency statistics."""
+
+        frames = video_dataset(self.data_root, self.csv_file)
+        frame_interval = 1 / self.params["fps"]
+
+        # the first call builds the graph: keep it out of the measurements
+        self.engine.push_frame(next(iter(frames))["image"].numpy())
+        self.engine.reset()
+
+        latencies = []
+        correct = 0
+        start = time.perf_counter()
+        for i, data in enumerate(frames):
+            image = data["image"].numpy()
+            arrival = start + i * frame_interval
+            if self.realtime:
+                time.sleep(max(0, arrival - time.perf_counter()))
+            else:
+                arrival = time.perf_counter()
+
+            prediction, _ = self.engine.push_frame(image)
+
+            latencies.append(time.perf_counter() - arrival)
+            correct += prediction == int(data["label"])
+
+        latencies = np.array(latencies) * 1000
+        print(f"Video: {self.csv_file.stem} ({len(latencies)} frames at {self.params['fps']} fps, realtime: {self.realtime})")
+        print(f"Latency (ms): mean {latencies.mean():.2f}, "
+              f"p50 {np.percentile(latencies, 50):.2f}, "
+              f"p95 {np.percentile(latencies, 95):.2f}, "
+              f"p99 {np.percentile(latencies, 99):.2f}, "
+              f"max {latencies.max():.2f}")
+        print(f"Frames exceeding the frame interval ({frame_interval * 1000:.2f} ms): {(latencies > frame_interval * 1000).sum()}")
+        print(f"Throughput: {len(latencies) / (time.perf_counter() - start):.2f} frames/s")
+        print(f"Accuracy: {correct / len(latencies):.4f}")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--data_path",
+        "--data-path",
+        type=str,
+        required=True,
+        help="Location of the prepared data",
+    )
+
+    parser.add_argument(
+        "--feature_extraction_weights_path",
+        "--feature-extraction-weights-path",
+        type=str,
+        required=True,
+        help="Location of feature extraction model weights",
+    )
+
+    parser.add_argument(
+        "--mstcn_weights_path",
+        "--mstcn-weights-path",
+        type=str,
+        required=True,
+        help="Location of mstcn model weights",
+    )
+
+    parser.add_argument(
+        "--params_file",
+        "--params-file",
+        type=str,
+        required=True,
+        help="Configuration file for the inference step",
+    )
+
+    parser.add_argument(
+        "--video",
+        type=str,
+        default=None,
+        help="Name of the video to replay (default: the first video)",
+    )
+
+    parser.add_argument(
+        "--no_realtime",
+        "--no-realtime",
+        action="store_true",
+        help="Give the frames as fast as possible instead of at the video fps",
+    )
+
+    args = parser.parse_args()
+    benchmark = StreamingBenchmark(args.data_path,
+                                   args.params_file,
+                                   args.feature_extraction_weights_path,
+                                   args.mstcn_weights_path,
+                                   args.video,
+                                   not args.no_realtime
+                                   )
+
+    benchmark.run()
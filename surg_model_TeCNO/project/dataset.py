@@ -1,13 +1,22 @@
 import csv
+import json
+import subprocess
 from functools import partial
 from pathlib import Path
 
+import numpy as np
 import tensorflow as tf
 from tensorflow.keras.applications.resnet import preprocess_input
 from tensorflow.keras.layers.experimental.preprocessing import Resizing
 
+from utils import get_file_basename, get_file_extention, probe_video, LabelsParser
+from columnar import COLUMNAR_EXTENSION, read_columnar
+
 AUTOTUNE = tf.data.experimental.AUTOTUNE
 
+# maximum number of frames read at once from a raw frames array
+RAW_CHUNK_SIZE = 64
+
 @tf.function
 def preprocess_input_fn(data, preprocessor):
     """Applies a transformation function on images.
@@ -28,6 +37,31 @@ def preprocess_input_fn(data, preprocessor):
 
     return new_data
 
+def decode_frame(img_bytes):
+    """Decodes an encoded frame. PNG and JPEG frames are decoded by 'tf.image.decode_image'. WebP
+    frames (found by their RIFF header) are decoded by 'tf.image.decode_webp', only provided
+    by recent TensorFlow versions.
+
+    Args:
+        img_bytes (tf.string): The encoded frame.
+
+    Returns:
+        3D-Tensor[tf.uint8]: The decoded (RGB) frame.
+
+    """
+    if not hasattr(tf.image, "decode_webp"):
+        return tf.image.decode_image(img_bytes, channels=3, dtype=tf.uint8, expand_animations=False)
+
+    def decode_webp():
+        # decode_webp may return a [num_frames, H, W, C] animation; frames have a single image
+        img = tf.image.decode_webp(img_bytes, channels=3)
+        return tf.reshape(img, tf.shape(img)[-3:])
+
+    is_webp = tf.strings.substr(img_bytes, 8, 4) == "WEBP"
+    return tf.cond(is_webp,
+                   decode_webp,
+                   lambda: tf.image.decode_image(img_bytes, channels=3, dtype=tf.uint8, expand_animations=False))
+
 @tf.function
 def read_image(data):
     """Reads an image file.
@@ -41,7 +75,7 @@ def read_image(data):
 
     """
     img = tf.io.read_file(data["image_path"])
-    img = tf.image.decode_image(img, channels=3, dtype=tf.uint8)
+    img = decode_frame(img)
     img.set_shape((None, None, 3))
 
     new_data = {"image": img}
@@ -49,6 +83,83 @@ def read_image(data):
 
     return new_data
 
+@tf.function
+def decode_image_bytes(data):
+    """Decodes an encoded image.
+
+    Args:
+        data (dict): A dictionary being at least {'image_bytes': tf.string}
+
+    Returns:
+        dict: The same input dict without 'image_bytes', and with an additional item:
+              {'image': 3D-Tensor[tf.uint8]}, the decoded image.
+
+    """
+    img = decode_frame(data["image_bytes"])
+    img.set_shape((None, None, 3))
+
+    new_data = {"image": img}
+    new_data.update({key:val for key,val in data.items() if key != "image_bytes"})
+
+    return new_data
+
+def read_shards(shard_paths, offsets, sizes):
+    """A generator reading frames stored in tar shards (the "shards" frames layout).
+    Each shard is read at once with a single sequential read, then its frames are sliced.
+
+    Args:
+        shard_paths (List[str]): The shard path of each frame.
+        offsets (List[int]): The offset of each frame data inside its shard.
+        sizes (List[int]): The size of each frame data.
+
+    Yields:
+        bytes: The encoded frames, in the given order.
+
+    """
+    current_shard_path = None
+    current_shard = None
+    for shard_path, offset, size in zip(shard_paths, offsets, sizes):
+        if shard_path != current_shard_path:
+            with open(shard_path, "rb") as f:
+                current_shard = f.read()
+            current_shard_path = shard_path
+        yield current_shard[offset:offset+size]
+
+def read_raw_frames(array_paths, indices, chunk_size=RAW_CHUNK_SIZE):
+    """A generator reading frames stored in raw frames arrays (the "raw" frames layout).
+    Each array is memory-mapped using its header, and runs of consecutive frames are read
+    as contiguous slices of the mapped array (of at most 'chunk_size' frames); no image
+    decoding is needed.
+
+    Args:
+        array_paths (List[str]): The raw frames array path of each frame.
+        indices (List[int]): The index of each frame inside its array.
+        chunk_size (int): The maximum number of frames read at once.
+
+    Yields:
+        4D-array[np.uint8]: Chunks of frames, in the given order.
+
+    """
+    current_array_path = None
+    current_array = None
+    i = 0
+    while i < len(indices):
+        array_path = array_paths[i]
+        if array_path != current_array_path:
+            with open(Path(array_path).parent / "header.json") as f:
+                header = json.load(f)
+            current_array = np.memmap(array_path, dtype=header["dtype"], mode="r", shape=tuple(header["shape"]))
+            current_array_path = array_path
+
+        # extend the chunk while the frames are consecutive in the same array
+        start = indices[i]
+        j = i + 1
+        while (j < len(indices) and j - i < chunk_size
+                and array_paths[j] == array_path and indices[j] == start + j - i):
+            j += 1
+        yield current_array[start:start + j - i]
+        i = j
+
 @tf.function
 def resize_map(data):
     """Resizes images to (224,224,3).
@@ -69,10 +180,89 @@ def resize_map(data):
     return new_data
 
 
-def backbone_dataset(data_root,
-                     batch_size):
+def read_video_table(csv_file):
+    """Reads the csv file of a video, or its columnar file (see 'columnar.write_columnar').
+
+    Args:
+        csv_file (Path): The path to the csv file (or columnar file) of the video.
+
+    Returns:
+        dict: The columns of the file (as lists or arrays), by column name.
+    """
+    if Path(csv_file).suffix == COLUMNAR_EXTENSION:
+        return read_columnar(csv_file)
+
+    with open(csv_file) as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        rows = list(reader)
+    return {name: [row[i] for row in rows] for i, name in enumerate(header)}
+
+
+def video_dataset(data_root, csv_file):
+    """Creates an (unbatched) Tensorflow dataset of the frames of a video.
+
+    Args:
+        data_root (Path): The path to the data.
+        csv_file (Path): The path to the csv file (or columnar file) of the video.
+
+    Returns:
+        tf.data.Dataset: A dataset of the video frames. A dataset example is a dict:
+                            {
+                                "image_path": (tf.string) Path to the frame
+                                "image: (3D-Tensor[tf.uint8]) The image
+                                "label: (tf.int32) The label
+                                "frame_id: (tf.int32) The frame ID
+                            }
+    """
+    table = read_video_table(csv_file)
+
+    # the "shards" and "raw" frames layouts files have extra columns:
+    # (shard_path, offset, size) and (array_path, index) respectively
+    layout = "shards" if "shard_path" in table else "raw" if "array_path" in table else "files"
+
+    frames = [str(data_root / path) for path in table["frame_path"]]
+    labels = np.asarray(table["label"], dtype=np.int32)
+    frame_ids = np.arange(1, len(frames) + 1, dtype=np.int32)
+    if layout == "shards":
+        shard_paths = [str(data_root / path) for path in table["shard_path"]]
+        offsets = np.asarray(table["offset"], dtype=np.int64)
+        sizes = np.asarray(table["size"], dtype=np.int64)
+    elif layout == "raw":
+        array_paths = [str(data_root / path) for path in table["array_path"]]
+        indices = [int(index) for index in table["index"]]
+
+    if layout == "raw":
+        # frames are already decoded: no read_image step
+        to_dict_fn = lambda img, others: {"image":img, "image_path":others[0], "label":others[1], "frame_id":others[2]}
+        images = (tf.data.Dataset.from_generator(partial(read_raw_frames, array_paths, indices),
+                                                 output_types=tf.uint8,
+                                                 output_shapes=(None, None, None, 3))
+                  .unbatch())
+        return (tf.data.Dataset.zip((images, tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))))
+                .map(to_dict_fn)
+                .apply(tf.data.experimental.assert_cardinality(len(frames))))
+
+    if layout == "files":
+        to_dict_fn = lambda img, label, frame_id: {"image_path":img, "label":label, "frame_id":frame_id}
+        return (tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))
+                .map(to_dict_fn)
+                .map(read_image, num_parallel_calls=AUTOTUNE))
+
+    # frames are read sequentially from the shards, then decoded in parallel
+    to_dict_fn = lambda img_bytes, img, label, frame_id: {"image_bytes":img_bytes, "image_path":img, "label":label, "frame_id":frame_id}
+    images_bytes = tf.data.Dataset.from_generator(partial(read_shards, shard_paths, offsets, sizes),
+                                                  output_types=tf.string,
+                                                  output_shapes=())
+    return (tf.data.Dataset.zip((images_bytes, tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))))
+            .map(lambda img_bytes, others: to_dict_fn(img_bytes, *others))
+            .apply(tf.data.experimental.assert_cardinality(len(frames)))
+            .map(decode_image_bytes, num_parallel_calls=AUTOTUNE))
+
+
+def prepared_video_datasets(data_root):
     
-    """Creates a Tensorflow dataset for each video.
+    """Creates an (unbatched) Tensorflow dataset for each video of the prepared data.
 
     Args:
         data_root (str): The path to the data. Expected to have the following structure:
@@ -95,20 +285,16 @@ def backbone_dataset(data_root,
                                     ├── some_video_name.csv
                                     ├── other_video_name.csv
                                     └ ...
-        
-        batch_size (int): The batch size.
+
+                         With the "shards" frames layout, each video folder in 'frames' contains
+                         tar shards instead, referenced by the csv files. With the "raw" frames
+                         layout, it contains one raw uint8 frames array and its header. With the
+                         "npz" metadata format, 'data_csv' contains '<video name>.npz' columnar files.
 
     Returns:
         A tuple consisting of:
             List[str]: A list of video names of the dataset
-            List[tf.data.Dataset]: A list of datasets; a dataset for each video.
-                                   A dataset example be a dict:
-                                        {
-                                            "image_path": (tf.string) Path to the frame
-                                            "image: (4D-Tensor[tf.float32]) A batch of images
-                                            "label: (1D-Tensor[tf.int32]) A batch of labels
-                                            "frame_id: (1D-Tensor[tf.int32]) A batch of frame IDs
-                                        }
+            List[tf.data.Dataset]: A list of datasets; a dataset for each video (described in 'video_dataset').
     """
 
     data_root = Path(data_root)
@@ -118,33 +304,185 @@ def backbone_dataset(data_root,
     
     datasets = list()
     csv_file_names = list()
-    
-    to_dict_fn = lambda img, label, frame_id: {"image_path":img, "label":label, "frame_id":frame_id}
 
     for csv_file in csv_files:
-        frames = list()
-        labels = list()
-        frame_ids = list()
-
-        with open(csv_file) as f:
-            reader = csv.reader(f)
-            for frame_id, row in enumerate(reader):
-                if frame_id == 0:
-                    continue
-                frames.append(row[0])
-                labels.append(int(row[1]))
-                frame_ids.append(frame_id)
-
-        frames = list(map(lambda path: str(data_root / path), frames))
-        
         csv_file_names.append(csv_file.name)
-        datasets.append(tf.data.Dataset.from_tensor_slices((frames, labels, frame_ids))
-                        .map(to_dict_fn)
-                        .map(read_image, num_parallel_calls=AUTOTUNE)
-                        .batch(batch_size)
-                        .map(resize_map, num_parallel_calls=AUTOTUNE)
-                        .map(partial(preprocess_input_fn, preprocessor=preprocess_input), num_parallel_calls=AUTOTUNE)
-                        .prefetch(AUTOTUNE)
-        )
+        datasets.append(video_dataset(data_root, csv_file))
     
-    return csv_file_names, datasets
\ No newline at end of file
+    return csv_file_names, datasets
+
+
+def decode_video_frames(video_path, fps, scale):
+    """A generator decoding the frames of a video with ffmpeg through a rawvideo pipe,
+    sampled and scaled the same way the data preparation MLCube extracts frames.
+
+    Args:
+        video_path (str): The path to the video file.
+        fps (int): The sampling rate of the frames.
+        scale (List[int]): The output frame scale (width, height).
+
+    Yields:
+        3D-array[np.uint8]: The decoded RGB frames.
+
+    Raises:
+        RuntimeError: if ffmpeg failed to decode the video.
+
+    """
+    width, height = scale
+    frame_size = width * height * 3
+    cmd = [
+        "ffmpeg", "-loglevel", "error", "-nostdin",
+        "-i", str(video_path),
+        "-vf", f"scale={width}:{height},fps={fps}",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "pipe:1"
+    ]
+    process = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        while True:
+            buffer = process.stdout.read(frame_size)
+            if len(buffer) < frame_size:
+                break
+            yield np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+
+        error = process.stderr.read().decode("utf-8", errors="replace").strip()
+        if process.wait() != 0:
+            raise RuntimeError(f"ffmpeg failed to decode {video_path}: {error}")
+    finally:
+        if process.poll() is None:
+            process.kill()
+            process.wait()
+        process.stdout.close()
+        process.stderr.close()
+
+def stream_video_frames(video_path, labels_file, params, videos_root):
+    """A generator of the labelled frames of a video, decoded directly from the video file.
+    Labels are parsed and sampled the same way the data preparation MLCube does: frames
+    with no label are skipped.
+
+    Args:
+        video_path (Path): The path to the video file.
+        labels_file (Path): The path to the labels file of the video.
+        params (dict): The configuration, having at least 'fps', 'scale', and 'labels'.
+        videos_root (Path): The path to the videos folder, used to build the (virtual) frame paths.
+
+    Yields:
+        A tuple consisting of:
+            3D-array[np.uint8]: The frame.
+            str: The (virtual) frame path, of the form '<videos_root>/frames/<video>/<video>_<frame number>'.
+            int: The label.
+            int: The frame ID.
+
+    """
+    video_fps = probe_video(str(video_path))["fps"]
+
+    # parse the labels, applying the effect of frame sampling
+    labels_data = LabelsParser.parse_labels(str(labels_file), video_fps, params["labels"],
+                                            step=round(video_fps/params["fps"]))
+
+    name = get_file_basename(str(video_path))
+    frame_id = 0
+    for i, image in enumerate(decode_video_frames(video_path, params["fps"], params["scale"])):
+        if i >= len(labels_data):
+            # drop video frames from end if they were not included in the labels file
+            break
+        if labels_data[i] == LabelsParser.MISSING:
+            continue
+        frame_id += 1
+        yield image, str(videos_root / "frames" / name / f"{name}_{i+1:06d}"), int(labels_data[i]), frame_id
+
+
+def stream_video_datasets(videos_path,
+                          labels_path,
+                          params):
+
+    """Creates an (unbatched) Tensorflow dataset for each video, decoding the videos directly (no prepared data).
+    A video is paired with the labels file of the same basename.
+
+    Args:
+        videos_path (str): The path to the folder containing the videos (.mp4).
+        labels_path (str): The path to the folder containing the labels files (.txt, .csv or .json).
+        params (dict): The configuration, having at least 'fps', 'scale', and 'labels'
+                       (same meaning as in the data preparation MLCube).
+
+    Returns:
+        Same as 'prepared_video_datasets'. Frame paths are virtual paths relative to 'videos_path'.
+
+    Warns:
+        if a video has no associated labels file.
+    """
+
+    videos_path = Path(videos_path)
+    labels_files = {get_file_basename(str(file)): file for file in Path(labels_path).glob("*")
+                        if get_file_extention(str(file)) in [".txt", ".csv", ".json"]}
+
+    video_files = list(videos_path.glob("*.mp4"))
+    video_files.sort()
+
+    datasets = list()
+    csv_file_names = list()
+
+    for video_file in video_files:
+        name = get_file_basename(str(video_file))
+        if name not in labels_files:
+            print(f"Warning: {video_file} has no associated labels. It will be ignored")
+            continue
+
+        csv_file_names.append(name + ".csv")
+        datasets.append(tf.data.Dataset.from_generator(partial(stream_video_frames, video_file, labels_files[name], params, videos_path),
+                                                       output_types=(tf.uint8, tf.string, tf.int32, tf.int32),
+                                                       output_shapes=((None, None, 3), (), (), ()))
+                        .map(lambda img, path, label, frame_id: {"image":img, "image_path":path, "label":label, "frame_id":frame_id})
+        )
+
+    return csv_file_names, datasets
+
+
+def backbone_dataset(datasets,
+                     batch_size):
+
+    """Creates a single Tensorflow dataset streaming the frames of all the given videos, one
+    video after the other, in fixed-size batches. Batches span video boundaries, so that only
+    the very last batch is partial and the pipeline never drains between videos. Each frame is
+    tagged with the index of its video, to re-split the outputs per video.
+
+    Args:
+        datasets (List[tf.data.Dataset]): The (unbatched) datasets of the videos, as created by
+                                          'prepared_video_datasets' or 'stream_video_datasets'.
+        batch_size (int): The batch size.
+
+    Returns:
+        tf.data.Dataset: A dataset of batches. A dataset example is a dict:
+                            {
+                                "image_path": (1D-Tensor[tf.string]) A batch of frame paths
+                                "image: (4D-Tensor[tf.float32]) A batch of images
+                                "label: (1D-Tensor[tf.int32]) A batch of labels
+                                "frame_id: (1D-Tensor[tf.int32]) A batch of frame IDs
+                                "video_id: (1D-Tensor[tf.int32]) A batch of video indices (in 'datasets')
+                            }
+                        The dataset is empty if 'datasets' is empty.
+    """
+
+    if not datasets:
+        # no videos to stream (e.g. all of them are cached): an empty dataset with the same structure
+        return tf.data.Dataset.from_tensor_slices({
+            "image_path": tf.zeros((0,), dtype=tf.string),
+            "image": tf.zeros((0, 224, 224, 3), dtype=tf.float32),
+            "label": tf.zeros((0,), dtype=tf.int32),
+            "frame_id": tf.zeros((0,), dtype=tf.int32),
+            "video_id": tf.zeros((0,), dtype=tf.int32)
+        }).batch(batch_size)
+
+    def add_video_id(video_id):
+        return lambda data: dict(data, video_id=tf.constant(video_id, dtype=tf.int32))
+
+    dataset = None
+    for video_id, video_frames in enumerate(datasets):
+        video_frames = video_frames.map(add_video_id(video_id))
+        dataset = video_frames if dataset is None else dataset.concatenate(video_frames)
+
+    return (dataset
+            .batch(batch_size)
+            .map(resize_map, num_parallel_calls=AUTOTUNE)
+            .map(partial(preprocess_input_fn, preprocessor=preprocess_input), num_parallel_calls=AUTOTUNE)
+            .prefetch(AUTOTUNE)
+    )
@@ -0,0 +1,268 @@
+import yaml
+import argparse
+from pathlib import Path
+
+import numpy as np
+from dataset import backbone_dataset, prepared_video_datasets, stream_video_datasets
+import tensorflow as tf
+from features import FeatureCache, checkpoint_prefix, checkpoint_hash, prepared_video_key, read_prep_manifest, video_file_key, save_video_features
+
+class FeatureExtraction:
+    def __init__(self, data_root,
+                       params_file,
+                       feature_extraction_weights_path,
+                       output_path=None,
+                       labels_path=None,
+                       feature_cache_path=None):
+
+        """Class wrapper for running only the feature extractor (ResNet50) of the model.
+
+        Args:
+            data_root (str): data location, with the same structure as for 'inference.Inference'.
+            params_file (str): yaml file with additional parameters
+            feature_extraction_weights_path (str): feature extraction model weights location
+            output_path (str, optional): location to store the features of each video. Only needed by 'run'.
+            labels_path (str, optional): labels files location. If given, 'data_root' is expected to be
+                                         a folder of videos (.mp4) that are decoded directly at the 'fps'
+                                         and 'scale' of the configuration, with no prepared data.
+            feature_cache_path (str, optional): location of a persistent cache of the feature-extractor outputs.
+                                                Videos found in the cache (same frames data and same feature
+                                                extraction weights) skip the feature extraction.
+
+        """
+
+        feature_extraction_weights_path = checkpoint_prefix(feature_extraction_weights_path)
+
+        with open(params_file, "r") as f:
+            self.params = yaml.full_load(f)
+
+        if labels_path is None:
+            self.video_file_names, self.datasets = prepared_video_datasets(data_root=data_root)
+        else:
+            self.video_file_names, self.datasets = stream_video_datasets(videos_path=data_root,
+                                                                         labels_path=labels_path,
+                                                                         params=self.params)
+
+        self.feature_extractor = tf.keras.applications.resnet50.ResNet50(include_top=False, pooling='avg', weights=None)
+        self.feature_extractor.load_weights(feature_extraction_weights_path)
+
+        self.out_path = None
+        if output_path is not None:
+            self.out_path = Path(output_path)
+            self.out_path.mkdir(exist_ok=True)
+
+        self.data_root = Path(data_root)
+        self.labels_path = Path(labels_path) if labels_path is not None else None
+        # read once for all the videos (see 'features.prepared_video_key')
+        self.prep_manifest = read_prep_manifest(self.data_root) if self.labels_path is None else None
+
+        self.feature_cache = None
+        if feature_cache_path is not None:
+            self.feature_cache = FeatureCache(feature_cache_path,
+                                              checkpoint_hash(feature_extraction_weights_path),
+                                              self.params.get("feature_cache_dtype", "float32"))
+
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, 224, 224, 3], dtype=tf.float32)])
+    def extract_batch_features(self, images):
+        """Runs the feature extractor on a batch of images
+
+        Args:
+            images (4D-Tensor[tf.float32]): a batch of preprocessed images
+
+        Returns:
+            2D-Tensor[tf.float32]: Features of the images.
+
+        """
+        return self.feature_extractor(images, training=False)
+
+    def extract_videos_features(self, video_indices):
+        """Runs the feature extractor on the given videos, through a single pipeline batching
+        frames across videos (see 'dataset.backbone_dataset'). The outputs are re-split per video
+        using the video index of each frame; a video is complete as soon as a frame of a later
+        video is seen, since videos are streamed one after the other.
+
+        Args:
+            video_indices (List[int]): The indices of the videos.
+
+        Yields:
+            A tuple consisting of:
+                int: The index of the video.
+                2D-array[np.float32]: Features for all frames of the video, sorted by frame.
+                1D-array[np.int32]: Ground-truth labels for all frames of the video.
+                1D-array[str]: frame paths, relative to the data folder, for all frames of the video.
+
+        """
+        dataset = backbone_dataset([self.datasets[i] for i in video_indices], self.params["batch_size"])
+        # the cardinality is unknown (negative) for videos decoded directly
+        num_batches = int(dataset.cardinality())
+
+        outputs = [{"features": [], "labels": [], "paths": [], "frame_ids": []} for _ in video_indices]
+
+        def flush(video_id):
+            video_outputs = outputs[video_id]
+            outputs[video_id] = None
+            if not video_outputs["frame_ids"]:
+                print(f"Warning: {self.video_file_names[video_indices[video_id]]} has no frames")
+                return video_indices[video_id], np.zeros((0, 2048), dtype=np.float32), np.zeros((0,), dtype=np.int32), []
+
+            sorting_indices = np.argsort(np.concatenate(video_outputs["frame_ids"]), kind="stable")
+            features = np.concatenate(video_outputs["features"])[sorting_indices]
+            labels = np.concatenate(video_outputs["labels"])[sorting_indices]
+            paths = np.concatenate(video_outputs["paths"])[sorting_indices]
+            paths = [str(Path(path.decode("utf-8")).relative_to(self.data_root)) for path in paths]
+            return video_indices[video_id], features, labels, paths
+
+        tf.print(f"Extracting features:")
+        next_video_id = 0
+        for batch_index, data_instance in enumerate(dataset):
+            tf.print("batch", batch_index, "/", num_batches)
+
+            batch = {
+                "features": self.extract_batch_features(data_instance["image"]).numpy(),
+                "labels": data_instance["label"].numpy(),
+                "paths": data_instance["image_path"].numpy(),
+                "frame_ids": data_instance["frame_id"].numpy()
+            }
+            video_ids = data_instance["video_id"].numpy()
+
+            for video_id in np.unique(video_ids):
+                in_video = video_ids == video_id
+                for key, values in batch.items():
+                    outputs[video_id][key].append(values[in_video])
+
+            # all the videos before the last one seen in the batch are complete
+            while next_video_id < video_ids[-1]:
+                yield flush(next_video_id)
+                next_video_id += 1
+
+        while next_video_id < len(video_indices):
+            yield flush(next_video_id)
+            next_video_id += 1
+
+    def video_key(self, i):
+        """Computes the key identifying the frames data of a video (see 'features.prepared_video_key'
+        and 'features.video_file_key').
+
+        Args:
+            i (int): The index of the video.
+
+        Returns:
+            str: The key.
+
+        """
+        video_name = Path(self.video_file_names[i]).stem
+        if self.labels_path is None:
+            return prepared_video_key(self.data_root, self.data_root / "data_csv" / self.video_file_names[i],
+                                      self.prep_manifest)
+
+        labels_file = [file for file in self.labels_path.glob(video_name + ".*")
+                       if file.suffix in [".txt", ".csv", ".json"]][0]
+        return video_file_key(self.data_root / (video_name + ".mp4"), labels_file, self.params)
+
+    def videos_features(self):
+        """Gets the features of all the videos. Videos found in the feature cache are loaded from it,
+        and all the other videos are run through the feature extractor together.
+
+        Yields:
+            A tuple consisting of:
+                int: The index of the video.
+                2D-array[np.float32]: Features for all frames of the video, sorted by frame.
+                1D-array[np.int32]: Ground-truth labels for all frames of the video.
+                1D-array[str]: frame paths, relative to the data folder, for all frames of the video.
+
+        """
+        to_extract = []
+        for i in range(len(self.datasets)):
+            if self.feature_cache is not None:
+                cached = self.feature_cache.load(self.video_key(i))
+                if cached is not None:
+                    tf.print(f"using cached features of {self.video_file_names[i]}")
+                    yield (i, *cached)
+                    continue
+            to_extract.append(i)
+
+        if not to_extract:
+            return
+
+        for i, features, labels, paths in self.extract_videos_features(to_extract):
+            if self.feature_cache is not None:
+                self.feature_cache.save(self.video_key(i), features, labels, paths)
+            yield i, features, labels, paths
+
+    def run(self):
+        """ Extracts the features of each video and stores them as '<video>.npz' (see 'features.save_video_features')."""
+
+        num_vids = len(self.datasets)
+        for count, (i, features, labels, paths) in enumerate(self.videos_features()):
+            tf.print(f"Video {count+1}/{num_vids}: {self.video_file_names[i]}")
+            out_file = self.out_path / (Path(self.video_file_names[i]).stem + ".npz")
+            save_video_features(out_file, features, labels, paths)
+
+
+if __name__ == "__main__":
+    # TODO: now picks the first visible gpu. can be an issue if it was in use by other processes
+    try:
+        tf.config.set_visible_devices(tf.config.list_physical_devices("GPU")[0], "GPU")
+    except IndexError:
+        tf.print("WARNING: no GPU was detected. Runnning on CPU.")
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--data_path",
+        "--data-path",
+        type=str,
+        required=True,
+        help="Location of data",
+    )
+
+    parser.add_argument(
+        "--feature_extraction_weights_path",
+        "--feature-extraction-weights-path",
+        type=str,
+        required=True,
+        help="Location of feature extraction model weights",
+    )
+
+    parser.add_argument(
+        "--params_file",
+        "--params-file",
+        type=str,
+        required=True,
+        help="Configuration file for the feature extraction step",
+    )
+
+    parser.add_argument(
+        "--output_path",
+        "--output-path",
+        type=str,
+        required=True,
+        help="Location to store the features",
+    )
+
+    parser.add_argument(
+        "--labels_path",
+        "--labels-path",
+        type=str,
+        default=None,
+        help="Location of labels. If given, data_path is expected to contain videos that are decoded directly",
+    )
+
+    parser.add_argument(
+        "--feature_cache_path",
+        "--feature-cache-path",
+        type=str,
+        default=None,
+        help="Location of a persistent cache of the feature extractor outputs",
+    )
+
+    args = parser.parse_args()
+    feature_extraction = FeatureExtraction(args.data_path,
+                                           args.params_file,
+                                           args.feature_extraction_weights_path,
+                                           args.output_path,
+                                           args.labels_path,
+                                           args.feature_cache_path
+                                           )
+
+    feature_extraction.run()
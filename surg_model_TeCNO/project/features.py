@@ -0,0 +1,220 @@
+import os
+import csv
+import json
+import hashlib
+from pathlib import Path
+
+import numpy as np
+from columnar import COLUMNAR_EXTENSION, read_columnar
+
+
+def checkpoint_prefix(weights_path):
+    """Finds the prefix of the TensorFlow checkpoint stored in a folder.
+
+    Args:
+        weights_path (str): The folder containing the checkpoint files.
+
+    Returns:
+        Path: The checkpoint prefix (e.g. 'weights/model' for 'weights/model.index').
+
+    """
+    # TODO: generalize this
+    weights_path = Path(weights_path)
+    prefix = list(weights_path.glob("*.index"))[0].name.replace(".index", "")
+    return weights_path / prefix
+
+
+def checkpoint_hash(checkpoint_prefix):
+    """Computes the content hash of a TensorFlow checkpoint.
+
+    Args:
+        checkpoint_prefix (Path): The checkpoint prefix (e.g. 'weights/model' for
+                                  'weights/model.index' and 'weights/model.data-*').
+
+    Returns:
+        str: The SHA-256 hex digest of the checkpoint files.
+
+    """
+    checkpoint_prefix = Path(checkpoint_prefix)
+    sha = hashlib.sha256()
+    for file in sorted(checkpoint_prefix.parent.glob(checkpoint_prefix.name + ".*")):
+        sha.update(file.name.encode("utf-8"))
+        with open(file, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha.update(chunk)
+    return sha.hexdigest()
+
+
+def read_prep_manifest(data_root):
+    """Reads the build manifest written by the data preparation MLCube ('manifest.json'), which
+    records the extraction of the frames of each video.
+
+    Args:
+        data_root (Path): The path to the prepared data.
+
+    Returns:
+        dict|None: The records of the videos, by video name, or None if there is no (valid) manifest.
+
+    """
+    manifest_file = Path(data_root) / "manifest.json"
+    if not manifest_file.exists():
+        return None
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)["videos"]
+    except (ValueError, KeyError):
+        return None
+
+
+def prepared_video_key(data_root, csv_file, manifest=None):
+    """Computes a key identifying the frames data of a prepared video. It covers the content of the
+    csv file (or columnar file) of the video, and the frames extraction record of the video in the
+    build manifest of the data preparation (the video file signature and the extraction parameters).
+
+    Without a manifest record, the size and modification time of the folders of the frame files
+    ("files" layout), or of the shards / raw frames array, are used instead: frame files are not
+    checked one by one.
+
+    Args:
+        data_root (Path): The path to the prepared data.
+        csv_file (Path): The path to the csv file of the video.
+        manifest (dict, optional): The build manifest records (see 'read_prep_manifest'). Read from
+                                   'data_root' if not given.
+
+    Returns:
+        str: The SHA-256 hex digest identifying the frames data.
+
+    """
+    sha = hashlib.sha256()
+    with open(csv_file, "rb") as f:
+        content = f.read()
+    sha.update(content)
+
+    if manifest is None:
+        manifest = read_prep_manifest(data_root)
+    record = (manifest or {}).get(Path(csv_file).stem, {}).get("frames")
+    if record is not None and record.get("complete", False):
+        sha.update(json.dumps(record, sort_keys=True).encode("utf-8"))
+        return sha.hexdigest()
+
+    if Path(csv_file).suffix == COLUMNAR_EXTENSION:
+        columns = read_columnar(csv_file)
+        header = list(columns)
+        rows = zip(*columns.values())
+    else:
+        rows = csv.reader(content.decode("utf-8").splitlines())
+        header = next(rows)
+    # frames are stored in shards / raw arrays (third column), or in frame files ("files" layout),
+    # whose folder is modified when frames are added, removed or renamed
+    storage_files = []
+    for row in rows:
+        storage_file = row[2] if len(header) > 2 else os.path.dirname(row[0])
+        if not storage_files or storage_files[-1] != storage_file:
+            storage_files.append(storage_file)
+
+    for file in storage_files:
+        stat = os.stat(Path(data_root) / file)
+        sha.update(f"{file}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+
+    return sha.hexdigest()
+
+
+def video_file_key(video_file, labels_file, params):
+    """Computes a key identifying the frames data of a video decoded directly. It covers
+    the size and modification time of the video, the content of the labels file, and the
+    decoding parameters.
+
+    Args:
+        video_file (Path): The path to the video file.
+        labels_file (Path): The path to the labels file of the video.
+        params (dict): The configuration, having at least 'fps', 'scale', and 'labels'.
+
+    Returns:
+        str: The SHA-256 hex digest identifying the frames data.
+
+    """
+    sha = hashlib.sha256()
+    stat = os.stat(video_file)
+    sha.update(f"{Path(video_file).name}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    with open(labels_file, "rb") as f:
+        sha.update(f.read())
+    sha.update(repr((params["fps"], params["scale"], params["labels"])).encode("utf-8"))
+    return sha.hexdigest()
+
+
+def save_video_features(out_file, features, labels, frame_paths, dtype="float32"):
+    """Stores the features of a video as an uncompressed .npz file with the arrays:
+        features (2D-array[dtype]): The features of all frames of the video, sorted by frame.
+        labels (1D-array[np.int32]): The ground-truth labels.
+        frame_paths (1D-array[str]): The frame paths, relative to the data folder.
+
+    Args:
+        out_file (Path|str): The output file.
+        features (2D-array[np.float32]): The features.
+        labels (1D-array[np.int32]): The ground-truth labels.
+        frame_paths (1D-array[str]): The frame paths, relative to the data folder.
+        dtype (str): The dtype the features are stored with (e.g. "float32" or "float16").
+
+    """
+    # write-then-rename so that an interrupted run never leaves a truncated file behind
+    tmp_file = str(out_file) + ".tmp.npz"
+    np.savez(tmp_file,
+             features=np.asarray(features).astype(dtype),
+             labels=np.asarray(labels, dtype=np.int32),
+             frame_paths=np.asarray(frame_paths).astype(str))
+    os.replace(tmp_file, out_file)
+
+
+def load_video_features(in_file):
+    """Loads the features of a video stored by 'save_video_features'.
+
+    Args:
+        in_file (Path|str): The features file.
+
+    Returns:
+        A tuple consisting of:
+            2D-array[np.float32]: The features.
+            1D-array[np.int32]: The ground-truth labels.
+            1D-array[str]: The frame paths, relative to the data folder.
+
+    """
+    with np.load(in_file) as data:
+        return (data["features"].astype(np.float32),
+                data["labels"],
+                data["frame_paths"])
+
+
+class FeatureCache:
+    def __init__(self, cache_path, weights_hash, dtype="float32"):
+        """A persistent store of the feature-extractor outputs of videos. An entry is
+        keyed by the frames data of a video (see 'prepared_video_key' and 'video_file_key')
+        and by the hash of the feature-extractor weights, so changing either results in
+        a cache miss.
+
+        Args:
+            cache_path (str): The folder to store the cached features in.
+            weights_hash (str): The hash of the feature-extractor weights.
+            dtype (str): The dtype the features are stored with.
+
+        methods:
+            load(): getting the cached features of a video, if any.
+            save(): caching the features of a video.
+
+        """
+        self.cache_path = Path(cache_path)
+        self.cache_path.mkdir(parents=True, exist_ok=True)
+        self.weights_hash = weights_hash
+        self.dtype = dtype
+
+    def entry_file(self, video_key):
+        key = hashlib.sha256(f"{video_key}:{self.weights_hash}:{self.dtype}".encode("utf-8")).hexdigest()
+        return self.cache_path / f"{key}.npz"
+
+    def load(self, video_key):
+        entry_file = self.entry_file(video_key)
+        if not entry_file.exists():
+            return None
+        return load_video_features(entry_file)
+
+    def save(self, video_key, features, labels, frame_paths):
+        save_video_features(self.entry_file(video_key), features, labels, frame_paths, self.dtype)
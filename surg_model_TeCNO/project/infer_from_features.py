@@ -0,0 +1,187 @@
+import yaml
+import argparse
+import csv
+from pathlib import Path
+
+import numpy as np
+import tensorflow as tf
+from models import MultiStageModel
+from features import checkpoint_prefix, load_video_features
+from columnar import COLUMNAR_EXTENSION, write_columnar
+
+class TemporalInference:
+    def __init__(self, params_file,
+                       mstcn_weights_path,
+                       output_path,
+                       features_path=None):
+
+        """Class wrapper for running only the multi-stage temporal convolutional network of the model,
+        on features stored by the feature extraction step.
+
+        Args:
+            params_file (str): yaml file with additional parameters
+            mstcn_weights_path (str): multi-stage temporal convolutional network weights location
+            output_path (str): location to store predictions
+            features_path (str, optional): features location, with one '<video>.npz' file per video
+                                           (see 'features.save_video_features'). Only needed by 'run'.
+
+        """
+
+        with open(params_file, "r") as f:
+            self.params = yaml.full_load(f)
+
+        self.mstcn = MultiStageModel(num_stages=self.params["num_stages"],
+                                     num_layers=self.params["num_layers"],
+                                     num_f_maps=self.params["num_f_maps"],
+                                     num_classes=self.params["num_classes"])
+
+        self.mstcn.build([None, 2048])
+        self.mstcn.load_weights(checkpoint_prefix(mstcn_weights_path))
+
+        self.out_path = Path(output_path)
+        self.out_path.mkdir(exist_ok=True)
+
+        self.features_path = Path(features_path) if features_path is not None else None
+
+        # predictions are stored as csv files, or as columnar files (see 'columnar.write_columnar')
+        self.predictions_extension = COLUMNAR_EXTENSION if self.params.get("metadata_format", "csv") == "npz" else ".csv"
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, 2048], dtype=tf.float32)])
+    def sequence_inference(self, features):
+        """Runs the multi-stage temporal convolutional network on a sequence of features
+
+        Args:
+            features (2D-Tensor[tf.float32]): Features of consecutive frames.
+
+        Returns:
+            1D-Tensor[tf.int64]: Predictions for all the frames.
+
+        """
+        probas = self.mstcn(features, training=False)
+        return tf.argmax(probas, axis=1)
+
+    def temporal_inference(self, video_features):
+        """Runs the multi-stage temporal convolutional network on the features of one video.
+
+        If 'mstcn_chunk_size' is set in the parameters, the video is processed in chunks of that
+        many frames, each preceded by the model receptive field (the number of past frames an
+        output depends on, see 'models.MultiStageModel') as left context. Since all the convolutions
+        are causal, the predictions are the same as when processing the whole video at once, while
+        the memory used by the model is bounded by the chunk size.
+
+        Args:
+            video_features (2D-Tensor[tf.float32]): Features for all frames of the video, sorted by frame.
+
+        Returns:
+            1D-Tensor[tf.int64]: Predictions for all frames of the video.
+
+        """
+        tf.print(f"running mstcn:")
+        chunk_size = self.params.get("mstcn_chunk_size")
+        num_frames = len(video_features)
+        if not chunk_size or num_frames <= chunk_size:
+            return self.sequence_inference(video_features)
+
+        context = self.mstcn.receptive_field
+        chunks_preds = []
+        for start in range(0, num_frames, chunk_size):
+            window_start = max(0, start - context)
+            window_preds = self.sequence_inference(video_features[window_start:start + chunk_size])
+            chunks_preds.append(window_preds[start - window_start:])
+
+        return tf.concat(chunks_preds, axis=0)
+
+    def predictions_file(self, video_name):
+        """Gets the output file of the predictions of a video.
+
+        Args:
+            video_name (str): The video name.
+
+        Returns:
+            Path: The output csv file (or columnar file, with the "npz" metadata format).
+
+        """
+        return self.out_path / (video_name + self.predictions_extension)
+
+    def save_video_predictions(self, preds, labels, paths, out_file):
+        """saves video predictions
+
+        Args:
+            preds (1D-array[np.int32]): Predictions for all frames of the video.
+            labels (1D-array[np.int32]): Ground-truth labels for all frames of the video.
+            labels (1D-array[str]): frame paths, relative to the data folder, for all frames of the video.
+            out_file (Path|str): output csv file path to store predictions in. Predictions are stored
+                                 in the columnar format if it has the '.npz' extension.
+
+        """
+
+        tf.print("saving video predictions")
+        if Path(out_file).suffix == COLUMNAR_EXTENSION:
+            write_columnar(out_file, {"frame_path": paths,
+                                      "label": np.asarray(labels, dtype=np.int32),
+                                      "prediction": np.asarray(preds, dtype=np.int32)})
+            return
+
+        with open(out_file, "w") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame_path", "label", "prediction"])
+            for frame_path, label, pred in zip(paths, labels, preds):
+                writer.writerow([frame_path, label, pred])
+
+    def run(self):
+        """ Runs the temporal model on the stored features of each video and stores the predicitons."""
+
+        features_files = sorted(self.features_path.glob("*.npz"))
+        num_vids = len(features_files)
+        for i, features_file in enumerate(features_files):
+            tf.print(f"Video {i+1}/{num_vids}")
+            features, labels, paths = load_video_features(features_file)
+            preds = self.temporal_inference(features)
+            out_file = self.predictions_file(features_file.stem)
+            self.save_video_predictions(preds.numpy(), labels, paths, out_file)
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--features_path",
+        "--features-path",
+        type=str,
+        required=True,
+        help="Location of the features stored by the feature extraction step",
+    )
+
+    parser.add_argument(
+        "--mstcn_weights_path",
+        "--mstcn-weights-path",
+        type=str,
+        required=True,
+        help="Location of mstcn model weights",
+    )
+
+    parser.add_argument(
+        "--params_file",
+        "--params-file",
+        type=str,
+        required=True,
+        help="Configuration file for the inference step",
+    )
+
+    parser.add_argument(
+        "--output_path",
+        "--output-path",
+        type=str,
+        required=True,
+        help="Location to store the predictions",
+    )
+
+    args = parser.parse_args()
+    temporal_inference = TemporalInference(args.params_file,
+                                           args.mstcn_weights_path,
+                                           args.output_path,
+                                           args.features_path
+                                           )
+
+    temporal_inference.run()
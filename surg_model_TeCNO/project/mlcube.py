@@ -1,26 +1,66 @@
 """MLCube handler file"""
 
 import typer
-import subprocess
+
+from inference import Inference
+from extract_features import FeatureExtraction
+from infer_from_features import TemporalInference
 
 
 app = typer.Typer()
 
 
-def exec_python(cmd: str) -> None:
-    splitted_cmd = cmd.split()
+class InferenceTask(object):
+    """
+    Task for preparing the data
 
-    process = subprocess.Popen(splitted_cmd, cwd=".")
-    process.wait()
+    Arguments:
+    - data_root: data location.
+    - feature_extraction_weights_path: feature extraction model weights location
+    - mstcn_weights_path: multi-stage temporal convolutional network weights location
+    - params_file: yaml file with additional parameters
+    - output_path: location to store predictions
+    - labels_path: labels location, when data_root contains videos to be decoded directly (optional)
+    - feature_cache_path: location of a persistent cache of the feature extractor outputs (optional)
+    """
 
+    @staticmethod
+    def run(
+        data_root: str, feature_extraction_weights_path: str, mstcn_weights_path: str, params_file: str, output_path: str, labels_path: str = None, feature_cache_path: str = None
+    ) -> None:
+        inference_model = Inference(data_root, params_file, feature_extraction_weights_path, mstcn_weights_path,
+                                    output_path, labels_path, feature_cache_path)
+        inference_model.run()
 
-class InferenceTask(object):
+
+class FeatureExtractionTask(object):
     """
-    Task for preparing the data
+    Task for running only the feature extractor and storing the features of each video
 
     Arguments:
     - data_root: data location.
     - feature_extraction_weights_path: feature extraction model weights location
+    - params_file: yaml file with additional parameters
+    - output_path: location to store the features
+    - labels_path: labels location, when data_root contains videos to be decoded directly (optional)
+    - feature_cache_path: location of a persistent cache of the feature extractor outputs (optional)
+    """
+
+    @staticmethod
+    def run(
+        data_root: str, feature_extraction_weights_path: str, params_file: str, output_path: str, labels_path: str = None, feature_cache_path: str = None
+    ) -> None:
+        feature_extraction = FeatureExtraction(data_root, params_file, feature_extraction_weights_path,
+                                               output_path, labels_path, feature_cache_path)
+        feature_extraction.run()
+
+
+class TemporalInferenceTask(object):
+    """
+    Task for running only the temporal model on stored features
+
+    Arguments:
+    - features_path: location of the features stored by the feature extraction task
     - mstcn_weights_path: multi-stage temporal convolutional network weights location
     - params_file: yaml file with additional parameters
     - output_path: location to store predictions
@@ -28,10 +68,10 @@ class InferenceTask(object):
 
     @staticmethod
     def run(
-        data_root: str, feature_extraction_weights_path: str, mstcn_weights_path: str, params_file: str, output_path: str
+        features_path: str, mstcn_weights_path: str, params_file: str, output_path: str
     ) -> None:
-        cmd = f"python3 inference.py --data_path={data_root} --feature_extraction_weights_path={feature_extraction_weights_path} --mstcn_weights_path={mstcn_weights_path} --params_file={params_file} --output_path={output_path}"
-        exec_python(cmd)
+        temporal_inference = TemporalInference(params_file, mstcn_weights_path, output_path, features_path)
+        temporal_inference.run()
 
 
 
@@ -42,8 +82,41 @@ def prepare(
     mstcn_weights: str = typer.Option(..., "--mstcn_weights"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
     output_path: str = typer.Option(..., "--output_path"),
+    feature_cache: str = typer.Option(None, "--feature_cache"),
+):
+    InferenceTask.run(data_path, feature_extractor_weights, mstcn_weights, parameters_file, output_path, feature_cache_path=feature_cache)
+
+@app.command("infer_videos")
+def infer_videos(
+    data_path: str = typer.Option(..., "--data_path"),
+    labels_path: str = typer.Option(..., "--labels_path"),
+    feature_extractor_weights: str = typer.Option(..., "--feature_extraction_weights"),
+    mstcn_weights: str = typer.Option(..., "--mstcn_weights"),
+    parameters_file: str = typer.Option(..., "--parameters_file"),
+    output_path: str = typer.Option(..., "--output_path"),
+    feature_cache: str = typer.Option(None, "--feature_cache"),
+):
+    InferenceTask.run(data_path, feature_extractor_weights, mstcn_weights, parameters_file, output_path, labels_path, feature_cache)
+
+@app.command("extract_features")
+def extract_features(
+    data_path: str = typer.Option(..., "--data_path"),
+    feature_extractor_weights: str = typer.Option(..., "--feature_extraction_weights"),
+    parameters_file: str = typer.Option(..., "--parameters_file"),
+    output_path: str = typer.Option(..., "--output_path"),
+    labels_path: str = typer.Option(None, "--labels_path"),
+    feature_cache: str = typer.Option(None, "--feature_cache"),
+):
+    FeatureExtractionTask.run(data_path, feature_extractor_weights, parameters_file, output_path, labels_path, feature_cache)
+
+@app.command("infer_from_features")
+def infer_from_features(
+    features_path: str = typer.Option(..., "--features_path"),
+    mstcn_weights: str = typer.Option(..., "--mstcn_weights"),
+    parameters_file: str = typer.Option(..., "--parameters_file"),
+    output_path: str = typer.Option(..., "--output_path"),
 ):
-    InferenceTask.run(data_path, feature_extractor_weights, mstcn_weights, parameters_file, output_path)
+    TemporalInferenceTask.run(features_path, mstcn_weights, parameters_file, output_path)
 
 @app.command("dummy")
 def dummy():
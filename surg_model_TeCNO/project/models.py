@@ -17,6 +17,9 @@ class DilatedResidualLayer(tf.keras.models.Model):
         self.conv_1x1 = tf.keras.layers.Conv1D(out_channels, 1, padding="causal")
         self.dropout = tf.keras.layers.Dropout(dropout_rate)
 
+        # number of past frames an output frame depends on
+        self.receptive_field = dilation * (kernel_size - 1)
+
     def call(self, inputs, training=False):
         x = self.conv_dilated(inputs)
         x = self.relu(x)
@@ -35,6 +38,8 @@ class SingleStageModel(tf.keras.models.Model):
         self.layers_list = [DilatedResidualLayer(2**i, num_f_maps) for i in range(num_layers)]
         self.conv_out_classes = tf.keras.layers.Conv1D(num_classes, 1,padding="causal")
 
+        self.receptive_field = sum(layer.receptive_field for layer in self.layers_list)
+
     def call(self, x, training=False):
         out = self.conv_1x1(x)
         for layer in self.layers_list:
@@ -54,6 +59,11 @@ class MultiStageModel(tf.keras.models.Model):
                                         num_f_maps,
                                         num_classes)
              for _ in range(num_stages - 1)]
+
+        # number of past frames an output frame depends on: num_stages * (2^(num_layers+1) - 2)
+        # for the default kernel size of 3. All the convolutions are causal, so an output frame
+        # does not depend on future frames.
+        self.receptive_field = sum(stage.receptive_field for stage in [self.stage1] + self.stages)
         
     def call(self, x, training=False):
         x = tf.expand_dims(x, axis=0)
@@ -0,0 +1,192 @@
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.applications.resnet import preprocess_input
+from tensorflow.keras.layers.experimental.preprocessing import Resizing
+
+
+class StreamingDilatedResidualLayer:
+    def __init__(self, layer):
+        """A stateful, frame by frame version of a trained 'models.DilatedResidualLayer'. Past
+        inputs of the layer are kept in a ring buffer spanning its receptive field, so that the
+        causal dilated convolution of a new frame only needs the inputs at t, t-d, t-2d, ...
+
+        Args:
+            layer (models.DilatedResidualLayer): The trained layer.
+
+        """
+        self.kernel = layer.conv_dilated.kernel.numpy()
+        self.bias = layer.conv_dilated.bias.numpy()
+        self.kernel_1x1 = layer.conv_1x1.kernel.numpy()[0]
+        self.bias_1x1 = layer.conv_1x1.bias.numpy()
+        self.dilation = layer.conv_dilated.dilation_rate[0]
+
+        self.buffer = np.zeros((layer.receptive_field + 1, self.kernel.shape[1]), dtype=np.float32)
+        self.position = 0
+
+    def reset(self):
+        self.buffer[:] = 0
+        self.position = 0
+
+    def step(self, inputs):
+        """Processes one frame.
+
+        Args:
+            inputs (1D-array[np.float32]): The layer inputs of the new frame.
+
+        Returns:
+            1D-array[np.float32]: The layer outputs of the new frame.
+
+        """
+        buffer_size = len(self.buffer)
+        self.buffer[self.position] = inputs
+
+        # the kernel tap k is applied to the input of (kernel_size - 1 - k) * dilation frames ago
+        kernel_size = len(self.kernel)
+        x = self.bias.copy()
+        for k in range(kernel_size):
+            past = (self.position - (kernel_size - 1 - k) * self.dilation) % buffer_size
+            x += self.buffer[past] @ self.kernel[k]
+
+        self.position = (self.position + 1) % buffer_size
+
+        x = np.maximum(x, 0)
+        x = x @ self.kernel_1x1 + self.bias_1x1
+        return inputs + x
+
+
+class StreamingSingleStageModel:
+    def __init__(self, stage):
+        """A stateful, frame by frame version of a trained 'models.SingleStageModel'.
+
+        Args:
+            stage (models.SingleStageModel): The trained stage.
+
+        """
+        self.kernel_in = stage.conv_1x1.kernel.numpy()[0]
+        self.bias_in = stage.conv_1x1.bias.numpy()
+        self.layers = [StreamingDilatedResidualLayer(layer) for layer in stage.layers_list]
+        self.kernel_out = stage.conv_out_classes.kernel.numpy()[0]
+        self.bias_out = stage.conv_out_classes.bias.numpy()
+
+    def reset(self):
+        for layer in self.layers:
+            layer.reset()
+
+    def step(self, inputs):
+        """Processes one frame.
+
+        Args:
+            inputs (1D-array[np.float32]): The stage inputs of the new frame.
+
+        Returns:
+            1D-array[np.float32]: The classes probabilities of the new frame.
+
+        """
+        out = inputs @ self.kernel_in + self.bias_in
+        for layer in self.layers:
+            out = layer.step(out)
+        logits = out @ self.kernel_out + self.bias_out
+        probas = np.exp(logits - logits.max())
+        return probas / probas.sum()
+
+
+class StreamingMultiStageModel:
+    def __init__(self, mstcn):
+        """A stateful, frame by frame version of a trained 'models.MultiStageModel'. Since all
+        the convolutions are causal, feeding the features of a video one frame at a time gives
+        the same predictions as running the model on the whole video, with O(num_layers) work
+        per frame instead of re-running the whole sequence.
+
+        Args:
+            mstcn (models.MultiStageModel): The trained (built) model.
+
+        methods:
+            step(): processing the features of a new frame.
+            reset(): clearing the state, before starting a new video.
+
+        """
+        self.stages = [StreamingSingleStageModel(stage) for stage in [mstcn.stage1] + mstcn.stages]
+
+    def reset(self):
+        for stage in self.stages:
+            stage.reset()
+
+    def step(self, features):
+        """Processes the features of a new frame.
+
+        Args:
+            features (1D-array[np.float32]): The features of the new frame.
+
+        Returns:
+            1D-array[np.float32]: The classes probabilities of the new frame.
+
+        """
+        out = np.asarray(features, dtype=np.float32)
+        for stage in self.stages:
+            out = stage.step(out)
+        return out
+
+
+class OnlinePhaseRecognition:
+    def __init__(self, feature_extractor, mstcn):
+        """Online phase recognition: frames of a video are given one at a time, as they are
+        captured, and the phase of each frame is predicted as soon as it is given.
+
+        Args:
+            feature_extractor (tf.keras.Model): The trained feature extractor (ResNet50).
+            mstcn (models.MultiStageModel): The trained (built) temporal model.
+
+        methods:
+            push_frame(): predicting the phase of a new frame.
+            push_features(): predicting the phase of a new frame from its features.
+            reset(): clearing the state, before starting a new video.
+
+        """
+        self.feature_extractor = feature_extractor
+        self.temporal_model = StreamingMultiStageModel(mstcn)
+        self.resizer = Resizing(224, 224)
+
+    def reset(self):
+        self.temporal_model.reset()
+
+    @tf.function(input_signature=[tf.TensorSpec(shape=[None, None, 3], dtype=tf.uint8)])
+    def frame_features(self, image):
+        """Runs the feature extractor on one frame, with the same preprocessing as 'dataset.backbone_dataset'.
+
+        Args:
+            image (3D-Tensor[tf.uint8]): The frame.
+
+        Returns:
+            1D-Tensor[tf.float32]: The features of the frame.
+
+        """
+        images = self.resizer(tf.expand_dims(image, axis=0))
+        images = preprocess_input(tf.cast(images, tf.float32))
+        return self.feature_extractor(images, training=False)[0]
+
+    def push_features(self, features):
+        """Predicts the phase of a new frame from its features.
+
+        Args:
+            features (1D-array[np.float32]): The features of the new frame.
+
+        Returns:
+            A tuple consisting of:
+                int: The predicted phase.
+                1D-array[np.float32]: The phases probabilities.
+
+        """
+        probas = self.temporal_model.step(features)
+        return int(np.argmax(probas)), probas
+
+    def push_frame(self, image):
+        """Predicts the phase of a new frame.
+
+        Args:
+            image (3D-array[np.uint8]): The new frame (RGB).
+
+        Returns:
+            Same as 'push_features'.
+
+        """
+        return self.push_features(self.frame_features(image).numpy())
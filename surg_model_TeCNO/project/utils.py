@@ -0,0 +1,428 @@
+"""Utilities shared with the data preparation MLCube (surg_prep). They are used by the
+direct video decoding mode, which prepares the videos on the fly, and should be kept in
+sync with their surg_prep counterparts."""
+
+import os
+import csv
+import json
+import subprocess
+from fractions import Fraction
+
+import numpy as np
+
+
+def get_file_basename(filename):
+    """A util function to get the basename of a file without the extension.
+    
+    Args:
+        filename (str): The file name.
+
+    Returns:
+        str: The basename of the file without the extension.
+    
+    """
+    return os.path.basename(os.path.splitext(filename)[0])
+
+def get_file_extention(filename):
+    """A util function to get the extension of a file.
+    
+    Args:
+        filename (str): The file name.
+
+    Returns:
+        str: The extension of the file.
+    
+    """
+    return os.path.splitext(filename)[1]
+
+
+def parse_frame_rate(rate):
+    """A util function to parse a frame rate reported by ffprobe.
+
+    Args:
+        rate (str): A frame rate of the form '<num>/<den>' or '<num>'.
+
+    Returns:
+        Fraction|None: The exact frame rate, or None if the rate is unknown (e.g. '0/0').
+
+    """
+    try:
+        rate = Fraction(rate)
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+    return rate if rate > 0 else None
+
+
+def probe_video(filename):
+    """Probes a video file once using ffprobe.
+
+    Args:
+        filename (str): The video file name.
+
+    Returns:
+        dict: The video metadata of the form:
+            {
+                "fps": <exact frame rate (Fraction)>,
+                "num_frames": <number of frames (int)>,
+                "duration": <duration in seconds (float)>,
+                "width": <frame width (int)>,
+                "height": <frame height (int)>,
+                "codec": <video codec name (str)>
+            }
+
+    Raises:
+        AssertionError: if the file could not be probed or has no video stream.
+
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=avg_frame_rate,r_frame_rate,nb_frames,duration,width,height,codec_name:format=duration",
+        "-of", "json", filename
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error = process.stderr.decode("utf-8", errors="replace").strip()
+        raise AssertionError(f"Could not probe {filename}: {error}")
+
+    probed = json.loads(process.stdout)
+    if not probed.get("streams"):
+        raise AssertionError(f"Could not probe {filename}: no video stream found")
+
+    stream = probed["streams"][0]
+    fps = parse_frame_rate(stream.get("avg_frame_rate")) or parse_frame_rate(stream.get("r_frame_rate"))
+    if fps is None:
+        raise AssertionError(f"Could not probe {filename}: unknown frame rate")
+
+    duration = stream.get("duration", probed.get("format", {}).get("duration"))
+    duration = float(duration) if duration is not None else None
+
+    num_frames = stream.get("nb_frames")
+    if num_frames is not None:
+        num_frames = int(num_frames)
+    elif duration is not None:
+        num_frames = round(duration*fps)
+
+    return {
+        "fps": fps,
+        "num_frames": num_frames,
+        "duration": duration,
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "codec": stream.get("codec_name"),
+    }
+
+
+class LabelsParser:
+    """This class contains static methods for parsing .txt, .csv, and .json labels files. Expected file 
+    structures are described in the docstrings of each format parser function. All parsers return an array
+    of M values, where M is the total number of frames of the associated original video file without any 
+    frame sampling and trimming (using the FPS information). A value of this array is either an integer
+    corresponding to the label index in the labels names list, or 'LabelsParser.MISSING' if the label is missing.
+    """
+
+    MISSING = -1
+    DTYPE = np.int16
+
+    def time_strs_to_sec(time_strs):
+        """A util function to convert timestamps to seconds.
+
+        Args:
+            time_strs (1D-array[str]): Timestamps of form 'hh:mm:ss.ss'.
+
+        Returns:
+            1D-array[np.float64]: The corresponding numbers of seconds.
+
+        Raises:
+            ValueError: if a timestamp is not of form 'hh:mm:ss.ss'.
+        
+        """
+        fields = np.char.split(time_strs, ":")
+        if len(fields) and any(len(field) != 3 for field in fields):
+            raise ValueError("Invalid timestamp")
+        fields = np.array(fields.tolist(), dtype=str).reshape(-1, 3)
+        hrs = fields[:, 0].astype(np.int64)
+        min = fields[:, 1].astype(np.int64)
+        sec = fields[:, 2].astype(np.float64)
+        return (hrs*3600 + min*60) + sec
+
+    def time_to_id(time_strs, fps):
+        """A util function to convert timestamps to frame_ids.
+
+        Args:
+            time_strs (1D-array[str]): Timestamps of form 'hh:mm:ss.ss'.
+            fps (Fraction|int): The FPS of the associated video.
+
+        Returns:
+            1D-array[np.int64]: The corresponding frame_ids.
+        
+        """
+        return np.round(float(fps)*LabelsParser.time_strs_to_sec(time_strs)).astype(np.int64)
+
+    def labels_to_ids(labels, labels_names, file):
+        """A util function to convert labels names to labels indices.
+
+        Args:
+            labels (1D-array[str]): The labels names.
+            labels_names (List[str]): A list of expected labels.
+            file (str): The labels file name, for the warnings.
+
+        Returns:
+            1D-array: The labels indices ('LabelsParser.MISSING' for unexpected labels names).
+
+        Warns:
+            if an unexpected label name is encountered.
+
+        """
+        lookup = {}
+        for i, name in enumerate(labels_names):
+            lookup.setdefault(name, i)
+
+        unique_labels, inverse = np.unique(labels, return_inverse=True)
+        unique_ids = np.empty(len(unique_labels), dtype=LabelsParser.DTYPE)
+        for i, label in enumerate(unique_labels):
+            if label not in lookup:
+                print(f"Warning: file {file} contains an unrecognized label: {label}")
+            unique_ids[i] = lookup.get(label, LabelsParser.MISSING)
+
+        return unique_ids[inverse]
+
+    def read_csv_txt_rows(file):
+        """Reads the rows of the .txt or .csv file (read once), checking its structure.
+        It should be two columns seperated by "," or "\\t".
+
+        Args:
+            file (str): The file name.
+
+        Returns:
+            2D-array[str]: The rows of the file, including the header.
+        
+        Raises:
+            AssertionError: if the file structure is not supported.
+        
+        """
+        with open(file) as f:
+            lines = f.read().splitlines()
+
+        for delimiter in [",", "\t"]:
+            rows = list(csv.reader(lines, delimiter=delimiter))
+            if all(len(row) == 2 for row in rows):
+                return np.array(rows, dtype=str).reshape(-1, 2)
+
+        raise AssertionError(f"Unrecognized file structure of {file}")
+        
+
+    def parse_csv_txt_labels(csv_txt_file, fps, labels_names):
+        """Parses a .csv or a .txt labels file. It expects the following file structure:
+        
+        <column-name><delimiter><column-name>
+        <timestamp><delimiter><label_name>
+        <timestamp><delimiter><label_name>
+        <timestamp><delimiter><label_name>
+        ...
+
+        Where:
+            The first line is a header,
+            <timestamp> can be a timestamp of form 'hh:mm:ss.ss' or a single frame_id integer,
+            <delimiter> can be "," or "\\t",
+            <label_name> is the label name.
+            
+    
+        Args:
+            csv_txt_file (str): The file name.
+            fps (Fraction|int): the FPS of the associated video.
+            labels_names (List[str]): A list of expected labels.
+
+        Returns:
+            1D-array[np.int16]: The parsed labels (Described in the class docstring)
+        
+        Raises:
+            AssertionError: if the file structure is not supported.
+        
+        Warns:
+            if an unexpected label name is encountered.
+        """
+        rows = LabelsParser.read_csv_txt_rows(csv_txt_file)
+        identifiers = rows[1:, 0]
+        labels = rows[1:, 1]
+
+        try:
+            identifiers = identifiers.astype(np.int64)
+        except ValueError:
+            try:
+                identifiers = LabelsParser.time_to_id(identifiers, fps)
+            except ValueError:
+                raise AssertionError(f"Invalid file {csv_txt_file}. Label files first column entries must be integers as frame IDs or a timestamp in the form of 'hh:mm:ss.ss'")
+
+        if not len(identifiers):
+            return np.full(0, LabelsParser.MISSING, dtype=LabelsParser.DTYPE)
+
+        label_ids = LabelsParser.labels_to_ids(labels, labels_names, csv_txt_file)
+        recognized = label_ids != LabelsParser.MISSING
+
+        parsed = np.full(identifiers.max() + 1, LabelsParser.MISSING, dtype=LabelsParser.DTYPE)
+        parsed[identifiers[recognized]] = label_ids[recognized]
+        
+        return parsed
+
+
+
+    def parse_json_intervals(json_file, fps, labels_names):
+        """Parses a .json labels file into intervals of frames. It expects the following minimal format:
+        A list of dictionaries in the following form:
+            {
+                'timestamp' : <starting timestamp of the label in milliseconds>
+                'duration' : <duration of the label in milliseconds>
+                'labelName' : <name of the label>
+            }
+        OR (depends on the version)
+            {
+                'timestamp' : <starting timestamp of the label in milliseconds>
+                'duration' :  <duration of the label in milliseconds>
+                'label' : {
+                                'name': <name of the label>
+                    }
+            }
+
+        Annotations are sorted by timestamp. If an annotation overlaps the next one, it is
+        cut where the next one starts.
+    
+        Args:
+            json_file (str): The file name.
+            fps (Fraction|int): the FPS of the associated video.
+            labels_names (List[str]): A list of expected labels.
+
+        Returns:
+            A tuple consisting of:
+                1D-array[np.int64]: The first frame_id of each interval.
+                1D-array[np.int64]: The frame_id following the last frame of each interval.
+                1D-array[np.int16]: The label of each interval ('LabelsParser.MISSING' for unexpected labels names).
+        
+        Raises:
+            AssertionError: if the file structure is not supported.
+        
+        Warns:
+            if an unexpected label name is encountered.
+        
+        """
+
+        with open(json_file) as f:
+            labels_dict = json.load(f)
+
+        try:
+            labels_dict.sort(key=lambda x:x['timestamp'])
+        except (KeyError, TypeError, AttributeError):
+            raise AssertionError(f"File {json_file} structure is not supported")
+
+        timestamps = []
+        durations = []
+        labels = []
+        for phase in labels_dict:
+            try:
+                duration, timestamp, label = phase['duration'], phase['timestamp'], phase['labelName']
+            except KeyError:
+                try:
+                    duration, timestamp, label = phase['duration'], phase['timestamp'], phase['label']['name']
+                except KeyError:
+                    raise AssertionError(f"File {json_file} structure is not supported")
+            timestamps.append(timestamp)
+            durations.append(duration)
+            labels.append(label)
+
+        # one conversion per annotation (not per frame), with the exact frame rate
+        starts = np.array([round(timestamp*fps/1000) for timestamp in timestamps], dtype=np.int64)
+        ends = np.array([round((timestamp + duration)*fps/1000) for timestamp, duration in zip(timestamps, durations)], dtype=np.int64)
+        label_ids = LabelsParser.labels_to_ids(np.array(labels, dtype=str), labels_names, json_file)
+
+        starts = np.maximum(starts, 0)
+        ends[:-1] = np.minimum(ends[:-1], starts[1:])
+        ends = np.maximum(ends, starts)
+
+        return starts, ends, label_ids
+
+    def sample_intervals(starts, ends, label_ids, step=1, start=0, end=None):
+        """Gets the labels of every 'step' frames from 'start' (frames start, start+step, ...) from
+        intervals of frames, without expanding the intervals frame by frame.
+
+        Args:
+            starts (1D-array[np.int64]): The first frame_id of each (sorted, non-overlapping) interval.
+            ends (1D-array[np.int64]): The frame_id following the last frame of each interval.
+            label_ids (1D-array[np.int16]): The label of each interval.
+            step (int): The sampling step.
+            start (int): The first frame_id to sample.
+            end (int, optional): The frame_id following the last frame to sample.
+
+        Returns:
+            1D-array[np.int16]: The labels of the sampled frames ('LabelsParser.MISSING' for frames not
+                                covered by any interval). The last sampled frame is the last labelled one
+                                (before 'end').
+
+        """
+        if not len(ends):
+            return np.full(0, LabelsParser.MISSING, dtype=LabelsParser.DTYPE)
+
+        last = ends.max() if end is None else min(ends.max(), end)
+        frame_ids = np.arange(start, last, step)
+
+        # the interval of a frame is the last one starting at or before it, if it is not over yet
+        interval = np.searchsorted(starts, frame_ids, side="right") - 1
+        covered = (interval >= 0) & (frame_ids < ends[np.maximum(interval, 0)])
+
+        sampled = np.full(len(frame_ids), LabelsParser.MISSING, dtype=LabelsParser.DTYPE)
+        sampled[covered] = label_ids[interval[covered]]
+        return sampled
+
+    def parse_json_labels(json_file, fps, labels_names):
+        """Parses a .json labels file (see 'parse_json_intervals' for the expected format).
+    
+        Args:
+            json_file (str): The file name.
+            fps (Fraction|int): the FPS of the associated video.
+            labels_names (List[str]): A list of expected labels.
+
+        Returns:
+            1D-array[np.int16]: The parsed labels (Described in the class docstring)
+        
+        Raises:
+            AssertionError: if the file structure is not supported.
+        
+        Warns:
+            if an unexpected label name is encountered.
+        
+        """
+        starts, ends, label_ids = LabelsParser.parse_json_intervals(json_file, fps, labels_names)
+
+        # each interval is preceded by a (possibly empty) gap of missing labels
+        gaps = starts - np.concatenate([[0], ends[:-1]])
+        values = np.stack([np.full(len(label_ids), LabelsParser.MISSING), label_ids], axis=1).ravel()
+        counts = np.stack([gaps, ends - starts], axis=1).ravel()
+        return np.repeat(values, counts).astype(LabelsParser.DTYPE)
+
+    def parse_labels(labels_file, fps, labels_names, step=1, start=0, end=None):
+        """Parses a .txt, .csv, or .json labels file, keeping the labels of every 'step' frames
+        from 'start' (frames start, start+step, ...) up to 'end', i.e. of the frames extracted
+        from a video trimmed to [start, end). The labels of .json files are sampled directly
+        from their intervals.
+
+        Args:
+            labels_file (str): The file name.
+            fps (Fraction|int): the FPS of the associated video.
+            labels_names (List[str]): A list of expected labels.
+            step (int): The sampling step.
+            start (int): The first frame_id to keep.
+            end (int, optional): The frame_id following the last frame to keep. Defaults to the last labelled frame.
+
+        Returns:
+            1D-array[np.int16]: The parsed labels of the sampled frames.
+
+        Raises:
+            AssertionError: if the file structure is not supported.
+
+        Warns:
+            if an unexpected label name is encountered.
+
+        """
+        if get_file_extention(labels_file) == ".json":
+            intervals = LabelsParser.parse_json_intervals(labels_file, fps, labels_names)
+            return LabelsParser.sample_intervals(*intervals, step=step, start=start, end=end)
+
+        return LabelsParser.parse_csv_txt_labels(labels_file, fps, labels_names)[start:end:step]
@@ -0,0 +1,160 @@
+import os
+import time
+import yaml
+import shutil
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+
+from utils import get_file_basename
+from prepare_data import extract_video_frames
+from raw_frames import raw_frames_file, read_raw_header
+from frame_formats import frame_extension
+
+
+# the compared frame formats: (name, frames layout, frame format parameters)
+BENCHMARK_FORMATS = [
+    ("png (ffmpeg default)", "files", {"frame_format": "png"}),
+    ("png, compression level 1", "files", {"frame_format": "png", "png_compression_level": 1}),
+    ("png, compression level 9", "files", {"frame_format": "png", "png_compression_level": 9}),
+    ("jpeg, qscale 2", "files", {"frame_format": "jpeg", "jpeg_qscale": 2}),
+    ("jpeg, qscale 5", "files", {"frame_format": "jpeg", "jpeg_qscale": 5}),
+    ("webp, quality 90", "files", {"frame_format": "webp", "webp_quality": 90}),
+    ("raw (uint8 RGB array)", "raw", {}),
+]
+
+
+def folder_size(folder):
+    """A util function to get the total size of the files of a folder, in bytes."""
+    with os.scandir(folder) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+
+def decode_throughput(folder, name, layout, params):
+    """Measures the decoding throughput of the extracted frames of a video. Encoded frames are
+    decoded by ffmpeg (to a null output); raw frames are read from the memory-mapped array.
+
+    Args:
+        folder (str): The frames folder of the video.
+        name (str): The video name.
+        layout (str): The frames layout ("files" or "raw").
+        params (dict): The configuration the frames were extracted with.
+
+    Returns:
+        float: The number of frames decoded per second.
+
+    """
+    if layout == "raw":
+        header = read_raw_header(folder)
+        start = time.perf_counter()
+        frames = np.memmap(raw_frames_file(folder, name), dtype=header["dtype"], mode="r", shape=tuple(header["shape"]))
+        for frame in frames:
+            # touch every byte, as an image decoder would
+            np.asarray(frame).max()
+        return len(frames) / (time.perf_counter() - start)
+
+    num_frames = len(os.listdir(folder))
+    cmd = [
+        "ffmpeg", "-loglevel", "error", "-nostdin", "-threads", "1",
+        "-i", os.path.join(folder, f"{name}_%06d{frame_extension(params)}"),
+        "-f", "null", "-"
+    ]
+    start = time.perf_counter()
+    subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL)
+    return num_frames / (time.perf_counter() - start)
+
+
+class FormatsBenchmark:
+    def __init__(self, video_path, params_file, duration=None):
+        """Compares the frame formats of the data preparation on a sample video: the time to extract
+        (decode the video and encode the frames), the size on disk, and the decoding throughput.
+
+        Args:
+            video_path (str): The sample video.
+            params_file (str): Configuration file for the data-preparation step ('fps' and 'scale' are used).
+            duration (float, optional): If given, only the first 'duration' seconds of the video are used.
+
+        """
+        with open(params_file, "r") as f:
+            self.params = yaml.full_load(f)
+
+        self.video_path = video_path
+        self.duration = duration
+
+    def run(self):
+        work_dir = tempfile.mkdtemp(prefix="surg_prep_benchmark_")
+        try:
+            video_path = self.video_path
+            if self.duration:
+                # cut the sample without re-encoding
+                video_path = os.path.join(work_dir, os.path.basename(self.video_path))
+                subprocess.run(["ffmpeg", "-loglevel", "error", "-nostdin", "-t", str(self.duration),
+                                "-i", self.video_path, "-c", "copy", video_path], check=True)
+            name = get_file_basename(video_path)
+
+            rows = []
+            num_frames = 0
+            for format_name, layout, format_params in BENCHMARK_FORMATS:
+                params = dict(self.params, frames_layout=layout, extraction_segments=1, **format_params)
+                folder = os.path.join(work_dir, "frames")
+                os.makedirs(folder)
+
+                start = time.perf_counter()
+                _, error, num_frames = extract_video_frames(video_path, folder, params)
+                encode_time = time.perf_counter() - start
+                if error is not None:
+                    print(f"Warning: {format_name} could not be benchmarked: {error}")
+                    shutil.rmtree(folder)
+                    continue
+
+                size = folder_size(folder)
+                decode_fps = decode_throughput(folder, name, layout, params)
+                rows.append([format_name,
+                             f"{encode_time:.2f}",
+                             f"{num_frames / encode_time:.1f}",
+                             f"{size / 2**20:.2f}",
+                             f"{size / num_frames / 2**10:.1f}",
+                             f"{decode_fps:.1f}"])
+                shutil.rmtree(folder)
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+        print(f"Video: {self.video_path} ({num_frames} frames at {self.params['fps']} fps, scale {self.params['scale']})")
+        header = ["frame format", "extraction time (s)", "extracted frames/s", "disk size (MB)",
+                  "size per frame (KB)", "decoded frames/s"]
+        print("| " + " | ".join(header) + " |")
+        print("|" + "|".join(["---"] * len(header)) + "|")
+        for row in rows:
+            print("| " + " | ".join(row) + " |")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+
+    parser.add_argument(
+        "--video_path",
+        "--video-path",
+        type=str,
+        required=True,
+        help="Location of the sample video",
+    )
+
+    parser.add_argument(
+        "--params_file",
+        "--params-file",
+        type=str,
+        required=True,
+        help="Configuration file for the data-preparation step",
+    )
+
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=None,
+        help="Only use the first seconds of the video",
+    )
+
+    args = parser.parse_args()
+    benchmark = FormatsBenchmark(args.video_path, args.params_file, args.duration)
+    benchmark.run()
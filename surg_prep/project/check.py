@@ -1,11 +1,48 @@
 import os
+import csv
+import json
+import itertools
 import yaml
 import argparse
+from concurrent.futures import ProcessPoolExecutor
 
 from utils import get_file_basename, get_file_extention
+from columnar import COLUMNAR_EXTENSION, read_columnar
+from frame_formats import FRAME_HEADER_SIZE, frame_extension, image_size
+
+
+def scan_prepared_data(data_path):
+    """Lists the content of the frames and csv data folders of the prepared data, once each.
+    The listing can be shared by the sanity checks and the statistics (see 'SanityChecks.run'
+    and 'statistics.Statistics.run').
+
+    Args:
+        data_path (str): The path to the folder of the prepared data.
+
+    Returns:
+        A tuple consisting of:
+            dict: For each entry of the frames folder, by path, whether it is a folder.
+            dict: For each entry of the csv data folder, by path, whether it is a file.
+
+    Raises:
+        AssertionError: if the frames folder or the csv data folder doesn't exist.
+
+    """
+    frames_path = os.path.join(data_path, "frames")
+    csv_path = os.path.join(data_path, "data_csv")
+
+    assert os.path.exists(frames_path), "frames folder doesn't exist"
+    assert os.path.exists(csv_path), "csv data folder doesn't exist"
+
+    with os.scandir(frames_path) as entries:
+        videos = {entry.path: entry.is_dir() for entry in entries}
+    with os.scandir(csv_path) as entries:
+        csv_files = {entry.path: entry.is_file() for entry in entries}
+    return videos, csv_files
+
 
 class SanityChecks:
-    def __init__(self, data_path, params_file):
+    def __init__(self, data_path, params_file, num_workers=None, deep=False):
         """A class wrapper for doing sanity checks on prepared dataset.
 
         The checks consist of raising an AssertionError if:
@@ -14,17 +51,29 @@ class SanityChecks:
             the frames folder is empty,
             the csv data folder is empty,
             the csv data folder contains folders,
-            the csv data folder contains non-csv files,
+            the csv data folder contains files other than csv or columnar (.npz) files,
             a csv file doesn't have a corresponding frames folder,
-            any extracted video frame is not .png,
+            any extracted video frame doesn't have the extension of the configured 'frame_format' (.png by default),
             labels are not integers between 0 and <total number of labels>,
             csv files contain invalid frames paths,
-            csv files have incorrect structure.
+            csv files reference frame data outside of their shard files (for the "shards" frames layout),
+            csv files reference frames outside of their raw frames array (for the "raw" frames layout),
+            raw frames arrays don't match their header, or the configured scale (for the "raw" frames layout),
+            csv files have incorrect structure,
+            (deep mode only) a frame is not a valid image of the configured format and scale.
+
+        Each video (csv file) is checked independently, and videos are checked in parallel.
+        The content of each frames folder is listed once, and csv files are streamed. Columnar
+        files (the "npz" metadata format) are read at once, and checked as the equivalent csv file.
 
         Args:
             data_path (str): The path to the folder of the prepared data, generated 
                              by the preparation step of the MLCube.
             params_file (str): Configuration file for the data-preparation step.
+            num_workers (int, optional): The number of videos to check in parallel. Defaults to the
+                                         'num_workers' parameter of the configuration, or 1.
+            deep (bool): Whether to also read the header of every frame to check it is a valid
+                         image of the configured format and scale.
 
         methods:
             run(): executing the sanity checks.
@@ -34,67 +83,196 @@ class SanityChecks:
             self.params = yaml.full_load(f)
 
         self.data_path = data_path
+        self.num_workers = num_workers or self.params.get("num_workers", 1)
+        self.deep = deep
+        self.frame_format = self.params.get("frame_format", "png")
+        self.frame_extension = frame_extension(self.params)
+
+        # the (width, height) of the frames, if both are fixed by the configuration
+        scale = self.params.get("scale")
+        self.frame_size = tuple(scale) if scale and all(int(side) > 0 for side in scale) else None
     
-    def run(self):
+    def check_raw_array(self, array_path):
+        """Checks a raw frames array (the "raw" frames layout) against its header.
+
+        Args:
+            array_path (str): The path to the raw frames array.
+
+        Returns:
+            int: The number of frames in the array.
+
         """
-        A lot of checks.
+        header_file = os.path.join(os.path.dirname(array_path), "header.json")
+        assert os.path.isfile(array_path), f"{array_path}: file doesn't exist"
+        assert os.path.isfile(header_file), f"{header_file}: file doesn't exist"
+        with open(header_file) as f:
+            header = json.load(f)
+
+        num_frames, height, width, channels = header["shape"]
+        assert header["dtype"] == "uint8" and channels == 3, f"{header_file}: frames should be uint8 RGB"
+        assert os.path.getsize(array_path) == num_frames * height * width * channels, \
+            f"{array_path}: file size doesn't match its header"
+        assert self.frame_size is None or (width, height) == self.frame_size, \
+            f"{header_file}: frames should have a (width, height) of {self.frame_size}"
+        return num_frames
+
+    def check_frame_header(self, frame_path, header):
+        """Checks that the data of a frame is an image of the configured format and scale.
+
+        Args:
+            frame_path (str): The frame path (for the error messages).
+            header (bytes): The first bytes of the frame data.
+
         """
-        frames_path = os.path.join(self.data_path, "frames")
-        csv_path = os.path.join(self.data_path, "data_csv")
+        size = image_size(header, self.frame_format)
+        assert size is not None, f"{frame_path}: frame is not a valid {self.frame_format} image"
+        assert self.frame_size is None or size == self.frame_size, \
+            f"{frame_path}: frame should have a (width, height) of {self.frame_size}, found {size}"
 
+    def read_rows(self, csv_file, read_file):
+        """A util function to iterate over the rows of the csv file of a video, header included.
 
-        assert os.path.exists(frames_path), "frames folder doesn't exist"
-        assert os.path.exists(csv_path), "csv data folder doesn't exist"
+        Args:
+            csv_file (str): The path to the csv file, or to the columnar file.
+            read_file (file): The opened csv file (unused for columnar files).
 
-        videos = os.listdir(frames_path)
-        csv_files = os.listdir(csv_path)
+        Returns:
+            Iterator[List[str]]: The rows.
 
-        assert videos, "frames folder is empty"
-        assert csv_files, "csv data folder is empty"
+        """
+        if get_file_extention(csv_file) != COLUMNAR_EXTENSION:
+            return csv.reader(read_file)
 
-        videos = list(map(lambda vidname: os.path.join(frames_path, vidname), videos))
-        csv_files = list(map(lambda csvname: os.path.join(csv_path, csvname), csv_files))
+        columns = read_columnar(csv_file)
+        rows = zip(*[values.astype(str) for values in columns.values()])
+        return itertools.chain([list(columns)], rows)
 
-        assert all(map(os.path.isdir, videos)), "frames folder contains files"
-        assert all(map(os.path.isfile, csv_files)), "csv data folder contains folders"
+    def check_video(self, csv_file, videos):
+        """Checks the csv file of a video and the frames it references.
 
-        assert all(map(lambda file: get_file_extention(file) == '.csv', csv_files)), "csv data folder contains non-csv files"
+        Args:
+            csv_file (str): The path to the csv file, or to the columnar file.
+            videos (Set[str]): The paths to the frames folders of all videos.
 
-        assert set(map(get_file_basename, csv_files)).issubset(map(get_file_basename, videos)), \
-                "some csv files don't have corresponding frames folder"
-        
+        Returns:
+            int: The number of checked frames.
+
+        """
         num_labels = len(self.params['labels'])
-        accepted_labels = [str(i) for i in range(num_labels)]
-        for csv_file in csv_files:
-            with open(csv_file) as read_file:
-                frame = 0
-                for line in read_file.readlines():
-                    if not frame: # header line
-                        frame += 1
-                        try:
-                            header1, header2 = line.strip().split(",")
-                        except ValueError:
-                            raise AssertionError("csv files are supposed to have two columns seperated by a comma")
-                        
-                        assert not os.path.exists(os.path.join(self.data_path, header1.strip())) or header2 not in accepted_labels,\
-                            "csv files must contain a header line"
-                        continue
+        accepted_labels = set(str(i) for i in range(num_labels))
+        layouts_headers = {
+            "shards": ["frame_path", "label", "shard_path", "offset", "size"],
+            "raw": ["frame_path", "label", "array_path", "index"],
+        }
+        folders_contents = {}
+        shards_sizes = {}
+        raw_arrays_lengths = {}
+        open_shards = {}
+        num_frames = 0
 
+        try:
+            with open(csv_file, newline="") as read_file:
+                reader = self.read_rows(csv_file, read_file)
+                header = [column.strip() for column in next(reader, [])]
+                layout = "files"
+                num_columns = 2
+                if header in layouts_headers.values():
+                    layout = [name for name, columns in layouts_headers.items() if columns == header][0]
+                    num_columns = len(header)
+                else:
                     try:
-                        frame_path, label = line.strip().split(",")
+                        header1, header2 = header
                     except ValueError:
                         raise AssertionError("csv files are supposed to have two columns seperated by a comma")
+
+                    assert not os.path.exists(os.path.join(self.data_path, header1)) or header2 not in accepted_labels,\
+                        "csv files must contain a header line"
+
+                for columns in reader:
+                    if len(columns) != num_columns:
+                        raise AssertionError(f"csv files are supposed to have {num_columns} columns seperated by a comma")
+                    frame_path, label = columns[0].strip(), columns[1].strip()
                     
-                    frame_path = os.path.join(self.data_path, frame_path.strip())
-                    
-                    assert os.path.exists(frame_path), f"{frame_path}: file doesn't exist"
-                    assert get_file_extention(frame_path) == ".png", f"frames should be .png"
-                    # TODO: assert frames have correct height and width
-                    assert os.path.split(frame_path)[0] in videos, f"csv files try to read frames from {os.path.split(frame_path)[0]}"
+                    frame_path = os.path.join(self.data_path, frame_path)
+                    frame_folder, frame_name = os.path.split(frame_path)
+                    assert frame_folder in videos, f"csv files try to read frames from {frame_folder}"
                     assert label in accepted_labels, f"labels are supposed to be integers between 0 and {num_labels}"
+                    
+                    if layout == "files":
+                        if frame_folder not in folders_contents:
+                            with os.scandir(frame_folder) as entries:
+                                folders_contents[frame_folder] = set(entry.name for entry in entries)
+                        assert frame_name in folders_contents[frame_folder], f"{frame_path}: file doesn't exist"
+                        assert get_file_extention(frame_path) == self.frame_extension, f"frames should be {self.frame_extension}"
+                        if self.deep:
+                            with open(frame_path, "rb") as f:
+                                self.check_frame_header(frame_path, f.read(FRAME_HEADER_SIZE))
+                    elif layout == "raw":
+                        array_path = os.path.join(self.data_path, columns[2].strip())
+                        if array_path not in raw_arrays_lengths:
+                            raw_arrays_lengths[array_path] = self.check_raw_array(array_path)
+                        assert 0 <= int(columns[3]) < raw_arrays_lengths[array_path], \
+                            f"{frame_path}: frame index is outside of {array_path}"
+                        assert os.path.split(array_path)[0] == frame_folder, \
+                            f"{frame_path}: frame is stored in the array of another video"
+                    else:
+                        shard_path = os.path.join(self.data_path, columns[2].strip())
+                        if shard_path not in shards_sizes:
+                            assert os.path.isfile(shard_path), f"{shard_path}: file doesn't exist"
+                            shards_sizes[shard_path] = os.path.getsize(shard_path)
+                        offset, size = int(columns[3]), int(columns[4])
+                        assert 0 <= offset and 0 < size and offset + size <= shards_sizes[shard_path], \
+                            f"{frame_path}: frame data is outside of {shard_path}"
+                        assert os.path.split(shard_path)[0] == frame_folder, \
+                            f"{frame_path}: frame is stored in the shard of another video"
+                        assert get_file_extention(frame_path) == self.frame_extension, f"frames should be {self.frame_extension}"
+                        if self.deep:
+                            if shard_path not in open_shards:
+                                open_shards[shard_path] = open(shard_path, "rb")
+                            open_shards[shard_path].seek(offset)
+                            self.check_frame_header(frame_path, open_shards[shard_path].read(min(size, FRAME_HEADER_SIZE)))
+                    num_frames += 1
+        finally:
+            for shard in open_shards.values():
+                shard.close()
+
+        return num_frames
+
+    def run(self, scan=None):
+        """
+        A lot of checks.
+
+        Args:
+            scan (tuple, optional): The listing of the prepared data folders, as returned by
+                                    'scan_prepared_data'. Scanned by default.
+        """
+        videos, csv_files = scan if scan is not None else scan_prepared_data(self.data_path)
+
+        assert videos, "frames folder is empty"
+        assert csv_files, "csv data folder is empty"
+
+        assert all(videos.values()), "frames folder contains files"
+        assert all(csv_files.values()), "csv data folder contains folders"
+
+        assert all(map(lambda file: get_file_extention(file) in ['.csv', COLUMNAR_EXTENSION], csv_files)), \
+                "csv data folder contains files other than csv or columnar (.npz) files"
+
+        assert set(map(get_file_basename, csv_files)).issubset(map(get_file_basename, videos)), \
+                "some csv files don't have corresponding frames folder"
+
+        videos = set(videos)
+        csv_files = sorted(csv_files)
+        num_frames = 0
+        if self.num_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                for checked in executor.map(self.check_video, csv_files, [videos]*len(csv_files)):
+                    num_frames += checked
+        else:
+            for csv_file in csv_files:
+                num_frames += self.check_video(csv_file, videos)
         
         # TODO: assert frames are sampled according to fps
-        print("Prepared data sucessfully passed all tests")
+        print(f"Prepared data sucessfully passed all tests ({len(csv_files)} videos, {num_frames} frames)")
 
 
 if __name__ == "__main__":
@@ -117,9 +295,26 @@ if __name__ == "__main__":
     )
 
 
+    parser.add_argument(
+        "--num_workers",
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Number of videos to check in parallel",
+    )
+
+    parser.add_argument(
+        "--deep",
+        action="store_true",
+        help="Also read the header of every frame to check it is a valid image of the configured format and scale",
+    )
+
+
     args = parser.parse_args()
     sanity_checker = SanityChecks( args.data_path,
                                  args.params_file,
+                                 args.num_workers,
+                                 args.deep,
                                 )
     sanity_checker.run()
 
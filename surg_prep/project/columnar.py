@@ -0,0 +1,142 @@
+import os
+import re
+
+import numpy as np
+
+
+COLUMNAR_EXTENSION = ".npz"
+
+# a frame path is split at its last number: <prefix><frame index><suffix>
+FRAME_PATH_PATTERN = re.compile(r"^(.*?)(\d+)(\D*)$")
+
+
+def frame_path_index(frame_path):
+    """Gets the frame index encoded in a frame path: its last number (see 'FRAME_PATH_PATTERN').
+
+    Args:
+        frame_path (str): The frame path.
+
+    Returns:
+        int|None: The frame index, or None if the path has no number.
+
+    """
+    match = FRAME_PATH_PATTERN.match(frame_path)
+    return None if match is None else int(match.group(2))
+
+
+def frame_path_template(frame_paths):
+    """Finds a path template generating the given frame paths from integer frame indices,
+    e.g. "frames/video/video_{:06d}.png" for "frames/video/video_000001.png", ...
+
+    Args:
+        frame_paths (List[str]): The frame paths.
+
+    Returns:
+        A tuple consisting of:
+            str|None: The template, or None if the paths don't share a common template.
+            1D-array[np.int64]|None: The frame index of each path, or None.
+
+    """
+    if not len(frame_paths):
+        return None, None
+
+    match = FRAME_PATH_PATTERN.match(frame_paths[0])
+    if match is None:
+        return None, None
+    prefix, number, suffix = match.groups()
+    number_format = "{:0%dd}" % len(number) if number.startswith("0") else "{:d}"
+    template = prefix.replace("{", "{{").replace("}", "}}") + number_format \
+               + suffix.replace("{", "{{").replace("}", "}}")
+
+    indices = np.empty(len(frame_paths), dtype=np.int64)
+    for i, path in enumerate(frame_paths):
+        match = FRAME_PATH_PATTERN.match(path)
+        if match is None or match.group(1) != prefix or match.group(3) != suffix:
+            return None, None
+        indices[i] = int(match.group(2))
+        if template.format(indices[i]) != path:
+            return None, None
+
+    return template, indices
+
+
+def write_columnar(out_file, columns):
+    """Writes the table of a video (one row per frame) in the compact columnar format: a compressed
+    .npz file with one array per column, read at once by 'read_columnar'.
+
+    The "frame_path" column is stored as a path template and an integer frame index per row
+    (see 'frame_path_template'), if the paths share a template. Other string columns (e.g. shard
+    paths) are dictionary-encoded: stored as their distinct values ('<column>_values') and the
+    integer code of each row ('<column>'). The 'columns' array stores the column names in order.
+
+    Args:
+        out_file (str): The output file.
+        columns (dict): The column arrays, by column name (in the csv header order).
+
+    """
+    arrays = {"columns": np.array(list(columns))}
+    for name, values in columns.items():
+        if name == "frame_path":
+            template, indices = frame_path_template(values)
+            if template is not None:
+                arrays["frame_path_template"] = np.array(template)
+                arrays["frame_index"] = indices.astype(np.int32)
+                continue
+
+        values = np.asarray(values)
+        if values.dtype.kind in "US":
+            distinct, codes = np.unique(values, return_inverse=True)
+            arrays[name + "_values"] = distinct
+            values = codes.astype(np.int32)
+        arrays[name] = values
+
+    # write-then-rename so that an interrupted run never leaves a truncated file behind
+    tmp_file = str(out_file) + ".tmp.npz"
+    np.savez_compressed(tmp_file, **arrays)
+    os.replace(tmp_file, out_file)
+
+
+def read_columnar(in_file, names=None):
+    """Reads the table of a video stored by 'write_columnar'.
+
+    Args:
+        in_file (str): The columnar file.
+        names (List[str], optional): The columns to read. Defaults to all the columns.
+
+    Returns:
+        dict: The column arrays, by column name (in the csv header order). String columns
+              (e.g. "frame_path") are arrays of str.
+
+    """
+    with np.load(in_file) as data:
+        columns = {}
+        for name in map(str, data["columns"]):
+            if names is not None and name not in names:
+                continue
+            if name == "frame_path" and "frame_path_template" in data.files:
+                template = str(data["frame_path_template"])
+                columns[name] = np.array([template.format(index) for index in data["frame_index"]], dtype=str)
+            elif name + "_values" in data.files:
+                columns[name] = data[name + "_values"][data[name]]
+            else:
+                columns[name] = data[name]
+        return columns
+
+
+def read_frame_indices(in_file):
+    """Reads the frame index encoded in the frame path of each row of a columnar file (see
+    'frame_path_index'), without building the frame paths if they are stored as a template.
+
+    Args:
+        in_file (str): The columnar file.
+
+    Returns:
+        1D-array[np.int64]|None: The frame indices, or None if a frame path has no number.
+
+    """
+    with np.load(in_file) as data:
+        if "frame_path_template" in data.files:
+            return data["frame_index"].astype(np.int64)
+
+    indices = [frame_path_index(path) for path in read_columnar(in_file, ["frame_path"])["frame_path"]]
+    return None if None in indices else np.array(indices, dtype=np.int64)
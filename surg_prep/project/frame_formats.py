@@ -0,0 +1,125 @@
+FRAME_EXTENSIONS = {"png": ".png", "jpeg": ".jpg", "webp": ".webp"}
+
+# number of bytes read from the beginning of a frame to find its size ('image_size')
+FRAME_HEADER_SIZE = 4096
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def frame_extension(params):
+    """A util function to get the file extension of the extracted frames.
+
+    Args:
+        params (dict): The data-preparation configuration.
+
+    Returns:
+        str: The extension (e.g. ".png").
+
+    """
+    return FRAME_EXTENSIONS[params.get("frame_format", "png")]
+
+
+def encoder_options(params):
+    """Gets the ffmpeg output options encoding the extracted frames in the configured format:
+        "png": lossless, with the 'png_compression_level' (0-9) if given (ffmpeg's default otherwise).
+        "jpeg": with the 'jpeg_qscale' quantizer (2-31, lower is better; default 2).
+        "webp": lossy, with the 'webp_quality' (0-100, higher is better; default 90).
+
+    Args:
+        params (dict): The data-preparation configuration.
+
+    Returns:
+        List[str]: The ffmpeg output options.
+
+    """
+    frame_format = params.get("frame_format", "png")
+    if frame_format == "jpeg":
+        return ["-c:v", "mjpeg", "-q:v", str(params.get("jpeg_qscale", 2))]
+    if frame_format == "webp":
+        return ["-c:v", "libwebp", "-lossless", "0", "-quality", str(params.get("webp_quality", 90))]
+    if "png_compression_level" in params:
+        return ["-compression_level", str(params["png_compression_level"])]
+    return []
+
+
+def png_size(header):
+    """Reads the size of a PNG image from the beginning of its data.
+
+    Args:
+        header (bytes): The first (at least 24) bytes of the image data.
+
+    Returns:
+        tuple|None: The (width, height) of the image, or None if the data is not a PNG image.
+
+    """
+    if len(header) < 24 or header[:8] != PNG_SIGNATURE or header[12:16] != b"IHDR":
+        return None
+    return int.from_bytes(header[16:20], "big"), int.from_bytes(header[20:24], "big")
+
+
+def jpeg_size(header):
+    """Reads the size of a JPEG image from the beginning of its data (its start of frame segment).
+
+    Args:
+        header (bytes): The first bytes of the image data, up to the start of frame segment.
+
+    Returns:
+        tuple|None: The (width, height) of the image, or None if the data is not a JPEG image
+                    or the start of frame segment is not in 'header'.
+
+    """
+    if header[:2] != b"\xff\xd8":
+        return None
+    position = 2
+    while position + 9 <= len(header):
+        if header[position] != 0xff:
+            return None
+        marker = header[position + 1]
+        # start of frame markers (SOF0-SOF15, except DHT, JPG and DAC)
+        if 0xc0 <= marker <= 0xcf and marker not in (0xc4, 0xc8, 0xcc):
+            height = int.from_bytes(header[position + 5:position + 7], "big")
+            width = int.from_bytes(header[position + 7:position + 9], "big")
+            return width, height
+        position += 2 + int.from_bytes(header[position + 2:position + 4], "big")
+    return None
+
+
+def webp_size(header):
+    """Reads the size of a WebP image from the beginning of its data.
+
+    Args:
+        header (bytes): The first (at least 30) bytes of the image data.
+
+    Returns:
+        tuple|None: The (width, height) of the image, or None if the data is not a WebP image.
+
+    """
+    if len(header) < 30 or header[:4] != b"RIFF" or header[8:12] != b"WEBP":
+        return None
+    chunk = header[12:16]
+    if chunk == b"VP8 ":
+        # lossy: 14-bit dimensions after the frame tag and the start code
+        return (int.from_bytes(header[26:28], "little") & 0x3fff,
+                int.from_bytes(header[28:30], "little") & 0x3fff)
+    if chunk == b"VP8L":
+        # lossless: 14-bit (dimension - 1) fields after the signature byte
+        bits = int.from_bytes(header[21:25], "little")
+        return (bits & 0x3fff) + 1, ((bits >> 14) & 0x3fff) + 1
+    if chunk == b"VP8X":
+        # extended: 24-bit (canvas dimension - 1) fields
+        return int.from_bytes(header[24:27], "little") + 1, int.from_bytes(header[27:30], "little") + 1
+    return None
+
+
+def image_size(header, frame_format):
+    """Reads the size of an image of the given format from the beginning of its data.
+
+    Args:
+        header (bytes): The first (up to 'FRAME_HEADER_SIZE') bytes of the image data.
+        frame_format (str): The image format ("png", "jpeg" or "webp").
+
+    Returns:
+        tuple|None: The (width, height) of the image, or None if the data is not a valid image of the format.
+
+    """
+    return {"png": png_size, "jpeg": jpeg_size, "webp": webp_size}[frame_format](header)
@@ -0,0 +1,75 @@
+import os
+import json
+
+
+class BuildManifest:
+    def __init__(self, output_path):
+        """An incremental build manifest of the prepared data, stored as 'manifest.json'
+        in the output folder. For each video and for each preparation stage (e.g. "frames",
+        "labels"), it records the inputs and the parameters the stage was completed with.
+        A stage of a video is considered done only if it was marked complete with the same
+        inputs and parameters, which allows re-running the preparation incrementally.
+
+        The manifest has the following structure:
+            {
+                "videos": {
+                    <video name>: {
+                        <stage>: {
+                            "inputs": <inputs signatures>,
+                            "params": <stage parameters>,
+                            "complete": true,
+                            ... <additional stage information>
+                        }
+                    }
+                }
+            }
+
+        Args:
+            output_path (str): Output folder of the prepared data.
+
+        methods:
+            is_complete(): checking if a stage of a video is done and up-to-date.
+            mark_complete(): recording a stage of a video as done.
+            invalidate(): removing the record of a stage of a video.
+            get(): getting the record of a stage of a video.
+            save(): storing the manifest on disk.
+
+        """
+        self.manifest_file = os.path.join(output_path, "manifest.json")
+        self.videos = {}
+
+        if os.path.exists(self.manifest_file):
+            try:
+                with open(self.manifest_file) as f:
+                    self.videos = json.load(f)["videos"]
+            except (ValueError, KeyError):
+                print(f"Warning: manifest {self.manifest_file} is corrupted. All videos will be prepared again.")
+
+    def get(self, video, stage):
+        return self.videos.get(video, {}).get(stage)
+
+    def is_complete(self, video, stage, inputs, params):
+        record = self.get(video, stage)
+        return (record is not None
+                and record.get("complete", False)
+                and record["inputs"] == inputs
+                and record["params"] == params)
+
+    def mark_complete(self, video, stage, inputs, params, **info):
+        record = {"inputs": inputs, "params": params, "complete": True}
+        record.update(info)
+        self.videos.setdefault(video, {})[stage] = record
+        self.save()
+
+    def invalidate(self, video, stage):
+        if self.videos.get(video, {}).pop(stage, None) is not None:
+            self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.manifest_file), exist_ok=True)
+
+        # write-then-rename so that an interrupted run never leaves a truncated manifest
+        tmp_file = self.manifest_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"videos": self.videos}, f, indent=4)
+        os.replace(tmp_file, self.manifest_file)
@@ -1,17 +1,13 @@
 """MLCube handler file"""
 
 import typer
-import subprocess
 
-
-app = typer.Typer()
+from prepare_data import DataPreparation
+from check import SanityChecks, scan_prepared_data
+from statistics import Statistics
 
 
-def exec_python(cmd: str) -> None:
-    splitted_cmd = cmd.split()
-
-    process = subprocess.Popen(splitted_cmd, cwd=".")
-    process.wait()
+app = typer.Typer()
 
 
 class PrepareTask(object):
@@ -23,14 +19,17 @@ class PrepareTask(object):
     - labels_path: labels location
     - params_file: yaml file with additional parameters
     - output_path: location to store prepared data
+    - num_workers: number of videos to extract in parallel (optional)
+    - start_end_file: csv file with the range of each video to keep (optional)
     """
 
     @staticmethod
     def run(
-        data_path: str, labels_path: str, params_file: str, output_path: str
+        data_path: str, labels_path: str, params_file: str, output_path: str, num_workers: int = None,
+        start_end_file: str = None
     ) -> None:
-        cmd = f"python3 prepare_data.py --data_path={data_path} --labels_path={labels_path} --params_file={params_file} --output_path={output_path}"
-        exec_python(cmd)
+        preprocessor = DataPreparation(data_path, labels_path, params_file, output_path, num_workers, start_end_file)
+        preprocessor.run()
 
 
 class SanityCheckTask(object):
@@ -40,12 +39,15 @@ class SanityCheckTask(object):
     Arguments:
     - data_path: data location.
     - params_file: location of parameters.yaml file
+    - num_workers: number of videos to check in parallel (optional)
+    - deep: whether to also check the header of every frame (optional)
+    - scan: listing of the data folders, from 'check.scan_prepared_data' (optional)
     """
 
     @staticmethod
-    def run(data_path: str, params_file: str) -> None:
-        cmd = f"python3 check.py --data_path={data_path} --params_file={params_file}"
-        exec_python(cmd)
+    def run(data_path: str, params_file: str, num_workers: int = None, deep: bool = False, scan: tuple = None) -> None:
+        sanity_checker = SanityChecks(data_path, params_file, num_workers, deep)
+        sanity_checker.run(scan)
 
 
 class StatisticsTask(object):
@@ -56,12 +58,41 @@ class StatisticsTask(object):
     - data_path: data location.
     - params_file: location of parameters.yaml file
     - out_path: location to store the statistics yaml file
+    - num_workers: number of csv files to process in parallel (optional)
+    - csv_files: paths to the csv files of the data, from 'check.scan_prepared_data' (optional)
+    """
+
+    @staticmethod
+    def run(data_path: str, params_file: str, out_path: str, num_workers: int = None, csv_files: list = None) -> None:
+        statistics_calculator = Statistics(data_path, params_file, out_path, num_workers)
+        statistics_calculator.run(csv_files)
+
+
+class PrepareCheckStatisticsTask(object):
+    """
+    Task for preparing the data, checking it, and generating its statistics in a single run.
+    The prepared data folders are scanned once, for both the checks and the statistics.
+
+    Arguments:
+    - data_path: data location.
+    - labels_path: labels location
+    - params_file: yaml file with additional parameters
+    - output_path: location to store prepared data
+    - statistics_path: location to store the statistics yaml file
+    - num_workers: number of videos to process in parallel (optional)
+    - start_end_file: csv file with the range of each video to keep (optional)
+    - deep: whether to also check the header of every frame (optional)
     """
 
     @staticmethod
-    def run(data_path: str, params_file: str, out_path: str) -> None:
-        cmd = f"python3 statistics.py --data_path={data_path} --params_file={params_file} --out_path={out_path}"
-        exec_python(cmd)
+    def run(
+        data_path: str, labels_path: str, params_file: str, output_path: str, statistics_path: str,
+        num_workers: int = None, start_end_file: str = None, deep: bool = False
+    ) -> None:
+        PrepareTask.run(data_path, labels_path, params_file, output_path, num_workers, start_end_file)
+        scan = scan_prepared_data(output_path)
+        SanityCheckTask.run(output_path, params_file, num_workers, deep, scan)
+        StatisticsTask.run(output_path, params_file, statistics_path, num_workers, list(scan[1]))
 
 @app.command("prepare")
 def prepare(
@@ -69,25 +100,45 @@ def prepare(
     labels_path: str = typer.Option(..., "--labels_path"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
     output_path: str = typer.Option(..., "--output_path"),
+    num_workers: int = typer.Option(None, "--num_workers"),
+    start_end_file: str = typer.Option(None, "--start_end_file"),
 ):
-    PrepareTask.run(data_path, labels_path, parameters_file, output_path)
+    PrepareTask.run(data_path, labels_path, parameters_file, output_path, num_workers, start_end_file)
 
 
 @app.command("sanity_check")
 def sanity_check(
     data_path: str = typer.Option(..., "--data_path"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
+    num_workers: int = typer.Option(None, "--num_workers"),
+    deep: bool = typer.Option(False, "--deep"),
 ):
-    SanityCheckTask.run(data_path, parameters_file)
+    SanityCheckTask.run(data_path, parameters_file, num_workers, deep)
 
 
 @app.command("statistics")
-def sanity_check(
+def statistics(
     data_path: str = typer.Option(..., "--data_path"),
     parameters_file: str = typer.Option(..., "--parameters_file"),
     out_path: str = typer.Option(..., "--output_path"),
+    num_workers: int = typer.Option(None, "--num_workers"),
+):
+    StatisticsTask.run(data_path, parameters_file, out_path, num_workers)
+
+
+@app.command("prepare_check_statistics")
+def prepare_check_statistics(
+    data_path: str = typer.Option(..., "--data_path"),
+    labels_path: str = typer.Option(..., "--labels_path"),
+    parameters_file: str = typer.Option(..., "--parameters_file"),
+    output_path: str = typer.Option(..., "--output_path"),
+    statistics_path: str = typer.Option(..., "--statistics_path"),
+    num_workers: int = typer.Option(None, "--num_workers"),
+    start_end_file: str = typer.Option(None, "--start_end_file"),
+    deep: bool = typer.Option(False, "--deep"),
 ):
-    StatisticsTask.run(data_path, parameters_file, out_path)
+    PrepareCheckStatisticsTask.run(data_path, labels_path, parameters_file, output_path, statistics_path,
+                                   num_workers, start_end_file, deep)
 
 
 if __name__ == "__main__":
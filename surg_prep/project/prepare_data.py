@@ -3,13 +3,246 @@ import os
 import yaml
 import argparse
 import csv
-
-from utils import get_file_basename, get_file_extention, get_video_fps
+import shutil
+import subprocess
+import tempfile
+import math
+import numpy as np
+from fractions import Fraction
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+
+from utils import get_file_basename, get_file_extention, file_signature, file_hash
 from utils import LabelsParser
+from video_metadata import VideoMetadataCache, probe_keyframes
+from manifest import BuildManifest
+from shards import pack_frames_into_shards, read_shards_index
+from raw_frames import raw_frames_file, write_raw_header, read_raw_header
+from columnar import COLUMNAR_EXTENSION, write_columnar
+from frame_formats import FRAME_EXTENSIONS, frame_extension, encoder_options
+from trimming import read_start_end_file, trim_frames
+
+
+def extraction_segments(vid_path, fps, num_segments, trim=None):
+    """Splits the frames extraction of a video into (about) 'num_segments' time ranges starting
+    at keyframes, that can be decoded concurrently (see 'extract_video_frames').
+
+    Frames are extracted at 'fps', so output frame k is taken at time k/fps (after the start of
+    the trimmed range, if 'trim' is given). A segment seeks to time m/fps, m being the first
+    output frame at or after one of its keyframes: decoding starts at that keyframe, and the
+    output frames timestamps keep the same grid as a sequential run. The first output frame of
+    a segment (m) is left to the previous segment, since the frame ffmpeg selects for it may be
+    before the seeking point.
+
+    The end of a trimmed range is also put on the output frames grid: the range [start, end)
+    has floor((end - start) * fps) output frames, whatever the number of segments.
+
+    Args:
+        vid_path (str): The path to the video file.
+        fps (int): The sampling rate of the extracted frames.
+        num_segments (int): The requested number of segments.
+        trim (tuple, optional): The (start, end) times (in seconds) of the range of the video to
+                                extract (end is None for the end of the video).
+
+    Returns:
+        List[tuple]: The segments, in order, as tuples (seek, start, end) of output frame
+                     indices: the segment seeks to 'seek'/fps (None for the first segment) and
+                     extracts the output frames 'start' to 'end' (excluded, None for the last
+                     segment of an untrimmed range). A single segment is returned if the video
+                     can't be split (e.g. its keyframes could not be probed).
+
+    """
+    fps = Fraction(fps)
+    keyframes = probe_keyframes(vid_path) if num_segments > 1 else []
+    duration = keyframes[-1] if keyframes else None
+    num_frames = None
+    if trim is not None:
+        # keyframes times relative to the start of the trimmed range
+        start, end = trim
+        keyframes = [time - float(start) for time in keyframes if start <= time and (end is None or time < end)]
+        if end is not None:
+            duration = float(end - start)
+            num_frames = math.floor((Fraction(end) - Fraction(start)) * fps)
+        elif keyframes:
+            duration = keyframes[-1]
+    if num_segments <= 1 or not keyframes:
+        return [(None, 0, num_frames)]
+
+    seeks = []
+    for i in range(1, num_segments):
+        target = duration * i / num_segments
+        keyframe = max([time for time in keyframes if time <= target], default=0)
+        seek = math.ceil(Fraction(keyframe) * fps)
+        if seek >= 1 and (not seeks or seek > seeks[-1] + 1) and (num_frames is None or seek + 1 < num_frames):
+            seeks.append(seek)
+
+    starts = [0] + [seek + 1 for seek in seeks]
+    ends = starts[1:] + [num_frames]
+    return list(zip([None] + seeks, starts, ends))
+
+
+def segment_command(vid_path, params, segment, output, trim=None):
+    """Builds the ffmpeg command extracting one segment of a video (see 'extraction_segments').
+    The trimmed range is selected with input options (seeking and duration), so the footage
+    outside of it is not decoded. Its end is given by the end of the last segment.
+
+    Args:
+        vid_path (str): The path to the video file.
+        params (dict): The data-preparation configuration.
+        segment (tuple): The (seek, start, end) output frame indices of the segment.
+        output (List[str]): The output options and file of the command.
+        trim (tuple, optional): The (start, end) times (in seconds) of the range of the video to
+                                extract. Only the start is used here.
+
+    Returns:
+        List[str]: The command.
+
+    """
+    scale = params["scale"]
+    fps = params["fps"]
+    seek, start, end = segment
+
+    trim_start = trim[0] if trim is not None else 0
+
+    filters = f"scale={scale[0]}:{scale[1]},fps={fps}"
+    seek_time = trim_start
+    duration = None
+    if seek is not None or end is not None:
+        seek = seek or 0
+        seek_time += seek / Fraction(fps)
+        # output frames timestamps (in 1/fps units) are relative to the seeking point
+        trim_filter = [f"start_pts={start - seek}"] if start > seek else []
+        if end is not None:
+            trim_filter.append(f"end_pts={end - seek}")
+            # stop decoding a few output frames after the end of the segment
+            duration = (end - seek + 2) / Fraction(fps)
+        if trim_filter:
+            filters += ",trim=" + ":".join(trim_filter)
+
+    input_options = []
+    if seek_time:
+        input_options += ["-ss", str(float(seek_time))]
+        # anchor the output frames grid at the seeking point, rather than at the first decoded
+        # frame (which is after it if the seeking point is between two frames of the video)
+        filters = filters.replace(f"fps={fps}", f"fps={fps}:start_time=0", 1)
+    if duration is not None:
+        input_options += ["-t", str(float(duration))]
+
+    return [
+        "ffmpeg", "-loglevel", "error", "-nostdin",
+        *input_options,
+        "-i", vid_path,
+        "-vf", filters,
+        *output
+    ]
+
+
+def run_commands(cmds):
+    """Runs commands concurrently.
+
+    Args:
+        cmds (List[List[str]]): The commands.
+
+    Returns:
+        str|None: An error message if any of the commands failed, None otherwise.
+
+    """
+    def run(cmd):
+        try:
+            process = subprocess.run(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        except OSError as e:
+            return str(e)
+        if process.returncode != 0:
+            error = process.stderr.decode("utf-8", errors="replace").strip()
+            return f"ffmpeg exited with code {process.returncode}: {error}"
+        return None
+
+    with ThreadPoolExecutor(max_workers=len(cmds)) as executor:
+        errors = [error for error in executor.map(run, cmds) if error is not None]
+    return errors[0] if errors else None
+
+
+def extract_video_frames(vid_path, out_folder, params, trim=None):
+    """Extracts the frames of a single video using ffmpeg. This function is
+    executed by the worker processes of 'DataPreparation.process_videos'.
+
+    With the "files" frames layout, frames are written as image files (png by default, see
+    'frame_formats.encoder_options') in the output folder.
+    With the "shards" layout, frames are first extracted in a temporary folder, then packed
+    into tar shards (see 'shards.pack_frames_into_shards') in the output folder.
+    With the "raw" layout, frames are written as one contiguous uint8 RGB array with a header
+    (see 'raw_frames.write_raw_header') in the output folder.
+
+    If 'extraction_segments' is greater than 1, the video is split into that many time ranges
+    at keyframes (see 'extraction_segments'), decoded concurrently by separate ffmpeg processes.
+    Each segment numbers its frames from its first output frame, so the extracted frames are
+    the same as with a single ffmpeg process.
+
+    If 'trim' is given, only the frames of that range of the video are extracted: ffmpeg seeks
+    to its start before decoding and stops decoding at its end.
+
+    Args:
+        vid_path (str): The path to the video file.
+        out_folder (str): The folder to write the extracted frames in.
+        params (dict): The data-preparation configuration.
+        trim (tuple, optional): The (start, end) times (in seconds) of the range of the video to
+                                extract (end is None for the end of the video).
+
+    Returns:
+        A tuple consisting of:
+            str: The path to the video file.
+            str|None: An error message if ffmpeg failed, None otherwise.
+            int: The number of extracted frames.
+
+    """
+    scale = params["scale"]
+    layout = params.get("frames_layout", "files")
+    segments = extraction_segments(vid_path, params["fps"], params.get("extraction_segments", 1), trim)
+
+    frames_folder = tempfile.mkdtemp(prefix="surg_prep_") if layout == "shards" else out_folder
+    imgs_prefix_name = os.path.join(frames_folder, get_file_basename(vid_path))
+    array_file = raw_frames_file(out_folder, get_file_basename(vid_path))
+    cmds = []
+    for i, segment in enumerate(segments):
+        if layout == "raw":
+            # segments are written in separate arrays, concatenated once all are extracted
+            segment_file = array_file if len(segments) == 1 else f"{array_file}.{i}"
+            output = ["-f", "rawvideo", "-pix_fmt", "rgb24", segment_file]
+        else:
+            # WARNING: videos with more than 10^6 frames may cause problems?
+            output = encoder_options(params) + [f"{imgs_prefix_name}_%06d{frame_extension(params)}"]
+            if segment[1]:
+                output = ["-start_number", str(segment[1] + 1)] + output
+        cmds.append(segment_command(vid_path, params, segment, output, trim))
+
+    try:
+        error = run_commands(cmds)
+        if error is not None:
+            return vid_path, error, 0
+
+        if layout == "raw" and len(segments) > 1:
+            with open(array_file, "wb") as f:
+                for i in range(len(segments)):
+                    with open(f"{array_file}.{i}", "rb") as segment_file:
+                        shutil.copyfileobj(segment_file, f, 1 << 24)
+                    os.remove(f"{array_file}.{i}")
+
+        if layout == "shards":
+            num_frames = pack_frames_into_shards(frames_folder, out_folder, get_file_basename(vid_path),
+                                                 params.get("frames_per_shard", 1000))
+        elif layout == "raw":
+            # ffmpeg's scale filter takes width:height
+            num_frames = write_raw_header(out_folder, get_file_basename(vid_path), height=scale[1], width=scale[0])
+        else:
+            num_frames = len(os.listdir(out_folder))
+    finally:
+        if frames_folder != out_folder:
+            shutil.rmtree(frames_folder, ignore_errors=True)
+
+    return vid_path, None, num_frames
 
 
 class DataPreparation:
-    def __init__(self, data_path, labels_path, params_file, output_path):
+    def __init__(self, data_path, labels_path, params_file, output_path, num_workers=None, start_end_file=None):
         """A class wrapper for preparing the data.
 
         Args:
@@ -17,6 +250,11 @@ class DataPreparation:
             labels_path (str): The path to the folder containing the labels.
             params_file (str): Configuration file for the data-preparation step.
             out_path (str): Output folder to store the prepared data.
+            num_workers (int, optional): Number of videos to extract in parallel. Overrides
+                                         'num_workers' of the configuration file (default: 1).
+            start_end_file (str, optional): A csv file with the range of each video to keep
+                                            (see 'trimming.read_start_end_file'). Videos are not
+                                            trimmed by default.
 
         methods:
             run(): executing the preparation task.
@@ -25,7 +263,11 @@ class DataPreparation:
                 get_and_check_video_files()
                 get_and_check_label_files()
                 assign_labels_to_videos()
+                assign_trimming_to_videos()
                 process_videos()
+
+            per-video steps called by 'process_videos':
+                parse_video_labels()
                 process_labels()
         
         """
@@ -35,9 +277,24 @@ class DataPreparation:
         self.data_path = data_path
         self.labels_path = labels_path
         self.output_path = output_path
+        self.num_workers = num_workers or self.params.get("num_workers", 1)
+        self.start_end_file = start_end_file
+        self.metadata_cache = VideoMetadataCache(os.path.join(output_path, "videos_metadata.json"))
+        self.manifest = BuildManifest(output_path)
+
+        self.supported_frames_layouts = ["files", "shards", "raw"]
+        assert self.params.get("frames_layout", "files") in self.supported_frames_layouts, \
+            f"frames_layout should be one of {self.supported_frames_layouts}"
+        assert self.params.get("frame_format", "png") in FRAME_EXTENSIONS, \
+            f"frame_format should be one of {list(FRAME_EXTENSIONS)}"
+
+        self.supported_metadata_formats = ["csv", "npz"]
+        assert self.params.get("metadata_format", "csv") in self.supported_metadata_formats, \
+            f"metadata_format should be one of {self.supported_metadata_formats}"
 
         self.supported_videos_paths = []
         self.supported_labels_paths = []
+        self.failed_videos = {}
 
         # TODO: check what ffmpeg is not capable of handling, or what it can handle but in a different way
         self.supported_video_extensions = [".mp4"]
@@ -81,15 +338,20 @@ class DataPreparation:
         'self.videos_labels_pairs' of the form:
             {<video_path>:{
                             "labels": <labels_file_path>,
-                            "fps": <video_fps>
+                            "fps": <video_fps (exact Fraction)>,
+                            "metadata": <video metadata, see 'video_metadata.probe_video'>
                             }
                 }
+
+        Videos metadata are read from the on-disk cache 'videos_metadata.json' of the output
+        folder; only new or modified videos are probed.
         
         Warns:
             if multiple video files of the same name but different extenstions were encountered,
             if multiple labels files of the same name but different extenstions were encountered,
             if a video file has no associated labels file,
-            if a labels file has no associated video file.
+            if a labels file has no associated video file,
+            if a video file could not be probed.
 
         """
 
@@ -133,7 +395,7 @@ class DataPreparation:
                 label_index = unique_labels.index(expected_label)
                 label_file = self.supported_labels_paths[label_index]
 
-                self.videos_labels_pairs[vid_path] = {"labels": label_file, "fps": get_video_fps(vid_path)}
+                self.videos_labels_pairs[vid_path] = {"labels": label_file}
                 matched_labels.append(label_file)
             else:
                 print(f"Warning: {self.supported_videos_paths[i]} has no associated labels. It will be ignored")
@@ -144,15 +406,99 @@ class DataPreparation:
                 if label not in matched_labels:
                     print(f"Warning: {self.supported_labels_paths[i]} has no associated video. It will be ignored")
 
+        # probe the videos metadata (cached across runs)
+        metadata, errors = self.metadata_cache.get(list(self.videos_labels_pairs.keys()))
+        for vid_path, error in errors.items():
+            print(f"Warning: {error}. It will be ignored")
+            self.videos_labels_pairs.pop(vid_path)
+
+        for vid_path, pair in self.videos_labels_pairs.items():
+            pair["metadata"] = metadata[vid_path]
+            pair["fps"] = metadata[vid_path]["fps"]
+
+    def assign_trimming_to_videos(self):
+        """Assigns to each video the range of its frames to keep, according to 'self.start_end_file',
+        as a "trim" entry of 'self.videos_labels_pairs':
+            "trim": <(first frame_id, frame_id following the last frame) of the original video, or None>
+
+        The end is None if the range goes to the end of the video. Videos not listed in the file
+        are not trimmed ("trim" is None). The frames outside the range are neither extracted
+        nor labelled.
+
+        Raises:
+            AssertionError: if the start/end file structure is not supported.
+
+        Warns:
+            if a video of the start/end file was not found,
+            if the range of a video is invalid. The video will be ignored.
+
+        """
+        start_end = read_start_end_file(self.start_end_file) if self.start_end_file else {}
+
+        videos_names = {get_file_basename(vid_path): vid_path for vid_path in self.videos_labels_pairs}
+        for name in start_end:
+            if name not in videos_names:
+                print(f"Warning: {name} of the start/end file {self.start_end_file} has no associated video. It will be ignored")
+
+        for name, vid_path in videos_names.items():
+            pair = self.videos_labels_pairs[vid_path]
+            pair["trim"] = None
+            if name not in start_end:
+                continue
+            try:
+                pair["trim"] = trim_frames(*start_end[name], pair["fps"], pair["metadata"]["num_frames"])
+            except AssertionError as e:
+                print(f"Warning: invalid start/end of {vid_path}: {e}. It will be ignored")
+                self.videos_labels_pairs.pop(vid_path)
+
+
+    def parse_video_labels(self, vid):
+        """Parses the labels file of a video, applying the effect of trimming and frame sampling.
+        It is executed while the videos are being extracted (see 'process_videos').
+
+        Args:
+            vid (str): The path to the video file.
+
+        Returns:
+            1D-array[np.int16]: The labels of the frames extracted from the video, starting at its
+                                first extracted frame (see 'LabelsParser.parse_labels').
+
+        Raises:
+            AssertionError: if the labels file structure is not supported.
+
+        Warns:
+            If the parsing functions raise warnings.
+
+        """
+        pair = self.videos_labels_pairs[vid]
+        start, end = pair["trim"] or (0, None)
+        return LabelsParser.parse_labels(pair["labels"], pair["fps"], self.params["labels"],
+                                         step=round(pair["fps"]/self.params["fps"]),
+                                         start=start, end=end)
 
     def process_videos(self):
         """
         Extracts frames from each video using ffmpeg according to 
         the FPS and the frame size specified in the configuration file.
+        Videos are extracted in parallel by 'self.num_workers' processes.
+        Videos that failed to be extracted are stored in 'self.failed_videos'
+        and are removed from 'self.videos_labels_pairs'.
+
+        The preparation is pipelined per video: the labels files are parsed in the background
+        while the videos are being extracted ('parse_video_labels'), only for the videos whose
+        csv file has to be written ('labels_up_to_date'), and the csv file of each
+        video is written as soon as its frames are extracted ('process_labels'), so completed
+        videos can be used while the others are still being extracted.
+
+        Trimmed videos (see 'assign_trimming_to_videos') are only decoded in their range.
+
+        A video is skipped if the build manifest records a complete extraction of the
+        same (unchanged) video file with the same FPS, scale and range. Otherwise, any existing
+        (partial or outdated) frames of the video are removed and it is extracted again.
         
         Warns:
-            If the output path already contains files or folders,
-            If a video has already been extracted (skips, even if it was partially extracted).
+            If a video has incomplete or outdated extracted frames,
+            If ffmpeg failed to extract a video.
 
         
         Note: videos with more than 10^6 frames will cause current ffmpeg command to overwrite extra frames.
@@ -164,45 +510,167 @@ class DataPreparation:
         frames_path = os.path.join(self.output_path, "frames")
         if not os.path.exists(frames_path):
             os.mkdir(frames_path)
-        else:
-            if os.listdir(frames_path):
-                print("Warning: found existing files/folders in frames output path.")
 
 
         scale = self.params["scale"]
         fps = self.params["fps"]
-
-        print(f"Extracting videos:\n\tSampling: {fps} frames per second\n\toutput frame scale: {scale[0]}-by-{scale[1]}\n")
-        for vid_path in tqdm(self.videos_labels_pairs.keys()):
+        layout = self.params.get("frames_layout", "files")
+        extraction_params = {"fps": fps, "scale": scale, "frames_layout": layout}
+        if layout == "shards":
+            extraction_params["frames_per_shard"] = self.params.get("frames_per_shard", 1000)
+        if layout != "raw":
+            # the frame format options, only recorded if set (so that existing extractions stay valid)
+            for key in ["frame_format", "png_compression_level", "jpeg_qscale", "webp_quality"]:
+                if key in self.params:
+                    extraction_params[key] = self.params[key]
+
+        jobs = {}
+        for vid_path in self.videos_labels_pairs.keys():
             file_name = get_file_basename(vid_path)
             out_folder = os.path.join(frames_path, file_name)
+            inputs = {"video": file_signature(vid_path)}
+
+            video_params = extraction_params
+            trim = self.videos_labels_pairs[vid_path]["trim"]
+            if trim is not None:
+                video_params = dict(extraction_params, trim=list(trim))
+                video_fps = self.videos_labels_pairs[vid_path]["fps"]
+                # the range in seconds, as given to ffmpeg
+                trim = (trim[0] / video_fps, None if trim[1] is None else trim[1] / video_fps)
+
+            if self.manifest.is_complete(file_name, "frames", inputs, video_params) and os.path.exists(out_folder):
+                print(f"The video ({file_name}) has already been extracted and is up-to-date. Skipping.")
+                continue
+
+            if os.path.exists(out_folder) and os.listdir(out_folder):
+                print(f"Warning: The video ({file_name}) has incomplete or outdated extracted frames. Extracting again.")
+                shutil.rmtree(out_folder)
+
+            self.manifest.invalidate(file_name, "frames")
+            os.makedirs(out_folder, exist_ok=True)
+            jobs[vid_path] = (out_folder, inputs, video_params, trim)
+
+        print(f"Extracting videos:\n\tSampling: {fps} frames per second\n\toutput frame scale: {scale[0]}-by-{scale[1]}\n\tframes layout: {layout}\n\tworkers: {self.num_workers}\n")
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor, \
+             ThreadPoolExecutor(max_workers=1) as labels_executor:
+            futures = [executor.submit(extract_video_frames, vid_path, out_folder, self.params, trim)
+                            for vid_path, (out_folder, _, _, trim) in jobs.items()]
+            # the labels files are only parsed for the videos whose csv file has to be written
+            labels_futures = {vid_path: labels_executor.submit(self.parse_video_labels, vid_path)
+                                for vid_path in self.videos_labels_pairs.keys()
+                                if vid_path in jobs or not self.labels_up_to_date(vid_path)}
+
+            # the videos that are already extracted can be labelled right away
+            for vid_path in labels_futures.keys():
+                if vid_path not in jobs:
+                    num_frames = self.manifest.get(get_file_basename(vid_path), "frames")["num_frames"]
+                    self.process_labels(vid_path, num_frames, labels_futures[vid_path])
+
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                vid_path, error, num_frames = future.result()
+                out_folder, inputs, video_params, _ = jobs[vid_path]
+                if error is None:
+                    self.manifest.mark_complete(get_file_basename(vid_path), "frames", inputs, video_params,
+                                                num_frames=num_frames)
+                    print(f"Done extracting: {vid_path}")
+                    self.process_labels(vid_path, num_frames, labels_futures.get(vid_path))
+                else:
+                    print(f"Warning: Failed extracting: {vid_path}")
+                    self.failed_videos[vid_path] = error
+                    # remove partial outputs so that the video is not skipped on the next run
+                    shutil.rmtree(out_folder, ignore_errors=True)
+
+        for vid_path, error in self.failed_videos.items():
+            print(f"Warning: {vid_path} could not be extracted. It will be ignored.\n\t{error}")
+            self.videos_labels_pairs.pop(vid_path, None)
+
+    def labels_stage(self, vid):
+        """Gets the build manifest record of the csv file of a video (see 'process_labels').
 
-            if not os.path.exists(out_folder):
-                os.mkdir(out_folder)
-            else:
-                if os.listdir(out_folder):
-                    print(f"Warning: It seems that the video ({file_name}) has already been already extracted. Skipping.")
-                    continue
+        Args:
+            vid (str): The path to the video file.
+
+        Returns:
+            A tuple consisting of:
+                str: The path to the csv file (or columnar file) of the video.
+                dict: The inputs of the file: the labels file content and the extracted frames record.
+                dict: The parameters of the file.
 
-            imgs_prefix_name = os.path.join(out_folder, file_name)
+        """
+        metadata_format = self.params.get("metadata_format", "csv")
+        labels_params = {"fps": self.params["fps"], "labels": self.params["labels"]}
+        if metadata_format != "csv":
+            labels_params["metadata_format"] = metadata_format
+        extension = COLUMNAR_EXTENSION if metadata_format == "npz" else ".csv"
 
-            os.system(
-                f'ffmpeg -loglevel quiet -i {vid_path} -vf "scale={scale[0]}:{scale[1]},fps={fps}" {imgs_prefix_name}_%06d.png'
-            ) # WARNING: videos with more than 10^6 frames may cause problems?
+        out_file = os.path.join(self.output_path, "data_csv", get_file_basename(vid)+extension)
 
-            print(f"Done extracting: {vid_path}")
+        inputs = {
+            "labels": file_hash(self.videos_labels_pairs[vid]["labels"]),
+            "frames": self.manifest.get(get_file_basename(vid), "frames")
+        }
+        return out_file, inputs, labels_params
+
+    def labels_up_to_date(self, vid):
+        """Checks whether the csv file of a video is up-to-date, according to the build manifest.
+
+        Args:
+            vid (str): The path to the video file.
+
+        Returns:
+            bool: True if the csv file does not have to be written again.
 
-    def process_labels(self):
         """
-        Parses labels files and creates a two-column csv file for each video of the format:
+        out_file, inputs, labels_params = self.labels_stage(vid)
+        return self.manifest.is_complete(get_file_basename(vid), "labels", inputs, labels_params) and os.path.exists(out_file)
+
+    def process_labels(self, vid, num_frames, labels_future=None):
+        """
+        Creates the two-column csv file of an extracted video, of the format:
 
         frame_path,                                 label
         <frame path relative to output folder>,     <label integer>
         <frame path relative to output folder>,     <label integer>
         ...
 
+        With the "shards" frames layout, the frame path is a virtual path (the frame's name
+        inside its shard), and three columns locating the frame data are added:
+
+        frame_path,     label,              shard_path,                                 offset,         size
+        <frame path>,   <label integer>,    <shard path relative to output folder>,     <in bytes>,     <in bytes>
+        ...
+
+        With the "raw" frames layout, the frame path is a virtual path as well, and two columns
+        locating the frame in the raw frames array of the video are added:
+
+        frame_path,     label,              array_path,                                 index
+        <frame path>,   <label integer>,    <array path relative to output folder>,     <frame index in the array>
+        ...
+
+        With the "npz" metadata format, the same columns are written in the compact columnar
+        format instead (see 'columnar.write_columnar'), as '<video name>.npz'.
+
+        The labels of trimmed videos are offset to the start of their range, so that they
+        match the extracted frames.
+
+        The frames names are generated from the number of extracted frames, without listing
+        the frames folder. The file is written under a temporary name and then renamed, so a
+        csv file in 'data_csv' is always complete.
+
+        A csv file is only written again if the labels file content, the extracted
+        frames of the video (including its range), or the FPS, labels and metadata format parameters changed
+        since it was last written (according to the build manifest).
+
+        Args:
+            vid (str): The path to the video file.
+            num_frames (int): The number of frames extracted from the video.
+            labels_future (Future, optional): The parsed labels of the video (see 'parse_video_labels').
+                                              If not given, the labels file is parsed when needed.
+
+        Raises:
+            AssertionError: if the labels file structure is not supported.
+
         Warns:
-            If the output path already contains files or folders,
             If any video frame has a missing label,
             If any extra label exists with no corresponding video frame,
             If the parsing functions raise warnings.
@@ -210,80 +678,107 @@ class DataPreparation:
 
         """
         csv_out_path = os.path.join(self.output_path, "data_csv")
-        if not os.path.exists(csv_out_path):
-            os.mkdir(csv_out_path)
+        os.makedirs(csv_out_path, exist_ok=True)
+
+        metadata_format = self.params.get("metadata_format", "csv")
+        out_file, inputs, labels_params = self.labels_stage(vid)
+        extension = os.path.splitext(out_file)[1]
+
+        if self.manifest.is_complete(get_file_basename(vid), "labels", inputs, labels_params) and os.path.exists(out_file):
+            return
+
+        frames_folder = os.path.join(self.output_path, "frames", get_file_basename(vid))
+
+        layout = self.params.get("frames_layout", "files")
+        if layout == "shards":
+            shards_index = read_shards_index(frames_folder)
+            frames = sorted(shards_index.keys())
+        elif layout == "raw":
+            raw_header = read_raw_header(frames_folder)
+            raw_frames = {f"{get_file_basename(vid)}_{i+1:06d}": i for i in range(num_frames)}
+            frames = list(raw_frames.keys())
+        else:
+            # the names of the frames written by 'extract_video_frames'
+            frames = [f"{get_file_basename(vid)}_{i+1:06d}{frame_extension(self.params)}" for i in range(num_frames)]
+
+        labels_data = labels_future.result() if labels_future is not None else self.parse_video_labels(vid)
+        frames = np.array(frames, dtype=str)
+
+        dropped_frames = 0
+        dropped_labels = 0
+
+        if len(frames) > len(labels_data):
+            # drop video frames from end if they were not included in the labels file
+            dropped_frames += len(frames) - len(labels_data)
+            frames = frames[:len(labels_data)]
+        
+        elif len(frames) < len(labels_data):
+            # drop labels from end if there was no corresponding frame
+            dropped_labels += len(labels_data) - len(frames)
+            labels_data = labels_data[:len(frames)]
+        
+        # if there is any other missing label, remove the corresponding frames
+        labelled = labels_data != LabelsParser.MISSING
+        frames = frames[labelled]
+        dropped_frames += len(labels_data) - len(frames)
+        labels_data = labels_data[labelled]
+
+        if layout == "shards":
+            header = ["frame_path", "label", "shard_path", "offset", "size"]
+            extra_columns = []
+            for frame in frames:
+                shard, offset, size = shards_index[frame]
+                extra_columns.append([os.path.relpath(os.path.join(frames_folder, shard), self.output_path), offset, size])
+        elif layout == "raw":
+            header = ["frame_path", "label", "array_path", "index"]
+            array_path = os.path.relpath(os.path.join(frames_folder, raw_header["array"]), self.output_path)
+            extra_columns = [[array_path, raw_frames[frame]] for frame in frames]
+        else:
+            header = ["frame_path", "label"]
+            extra_columns = [[] for frame in frames]
+
+        frames = list(map(lambda x: os.path.join(frames_folder, x), frames))
+        frames = list(map(lambda x: os.path.relpath(x, self.output_path), frames))
+
+        # write the data, removing the file of the other format if any
+        for other_extension in {".csv", COLUMNAR_EXTENSION} - {extension}:
+            other_file = os.path.join(csv_out_path, get_file_basename(vid)+other_extension)
+            if os.path.exists(other_file):
+                os.remove(other_file)
+
+        if metadata_format == "npz":
+            columns = {"frame_path": frames, "label": labels_data}
+            for i, name in enumerate(header[2:]):
+                columns[name] = [row[i] for row in extra_columns]
+            write_columnar(out_file, columns)
         else:
-            if os.listdir(csv_out_path):
-                print("Warning: found existing files/folders in csv files output path.")
-
-        for vid in self.videos_labels_pairs.keys():
-            
-            out_file = os.path.join(csv_out_path, get_file_basename(vid)+".csv")
-
-            frames_folder = os.path.join(self.output_path, "frames", get_file_basename(vid))
-
-            frames = os.listdir(frames_folder)
-            frames.sort()
-
-
-            labels_file = self.videos_labels_pairs[vid]["labels"]
-            video_fps = self.videos_labels_pairs[vid]["fps"]
-
-            labels_file_type = get_file_extention(labels_file)
-            if labels_file_type in [".csv", ".txt"]:
-                labels_data = LabelsParser.parse_csv_txt_labels(labels_file, video_fps, self.params["labels"])
-            elif labels_file_type == ".json":
-                labels_data = LabelsParser.parse_json_labels(labels_file, video_fps, self.params["labels"])
-
-            # apply the effect of frame sampling
-            labels_data = labels_data[::round(video_fps/self.params["fps"])]
-
-            dropped_frames = 0
-            dropped_labels = 0
-
-            if len(frames) > len(labels_data):
-                # drop video frames from end if they were not included in the labels file
-                dropped_frames += len(frames) - len(labels_data)
-                frames = frames[:len(labels_data)]
-            
-            elif len(frames) < len(labels_data):
-                # drop labels from end if there was no corresponding frame
-                dropped_labels += len(labels_data) - len(frames)
-                labels_data = labels_data[:len(frames)]
-            
-            # if there is any other missing label, remove the corresponding frames
-            frames = [frame for i, frame in enumerate(frames) if labels_data[i] != None]
-            dropped_frames += len(labels_data) - len(frames)
-            labels_data = [label for label in labels_data if label != None]
-
-            frames = list(map(lambda x: os.path.join(frames_folder, x), frames))
-            frames = list(map(lambda x: os.path.relpath(x, self.output_path), frames))
-
-            # write the data
-            with open(out_file, "w") as f:
+            # write-then-rename so that a csv file being used is always complete
+            tmp_file = out_file + ".tmp"
+            with open(tmp_file, "w") as f:
                 writer = csv.writer(f)
-                writer.writerow(["frame_path", "label"])
-                for frame_path, label in zip(frames, labels_data):
-                    writer.writerow([frame_path, label])
-            
-            if dropped_frames:
-                print(f"Warning: {dropped_frames} frames of the video {vid} have no corresponding labels.")
-            
-            if dropped_labels:
-                print(f"Warning: {dropped_labels} extra labels for the video {vid} has been neglected.")
-            
+                writer.writerow(header)
+                for frame_path, label, columns in zip(frames, labels_data, extra_columns):
+                    writer.writerow([frame_path, label, *columns])
+            os.replace(tmp_file, out_file)
 
+        self.manifest.mark_complete(get_file_basename(vid), "labels", inputs, labels_params,
+                                    num_frames=len(frames))
+        
+        if dropped_frames:
+            print(f"Warning: {dropped_frames} frames of the video {vid} have no corresponding labels.")
+        
+        if dropped_labels:
+            print(f"Warning: {dropped_labels} extra labels for the video {vid} has been neglected.")
 
-    def run(self):
-        # TODO: add an extra step of trimming videos according to a start_end_file.csv
 
+    def run(self):
         self.get_and_check_video_files()
         self.get_and_check_label_files()
 
         self.assign_labels_to_videos()
+        self.assign_trimming_to_videos()
 
         self.process_videos()
-        self.process_labels()
 
 
 
@@ -323,11 +818,29 @@ if __name__ == "__main__":
         help="Location to store the prepared data",
     )
 
+    parser.add_argument(
+        "--num_workers",
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Number of videos to extract in parallel (overrides the configuration file)",
+    )
+
+    parser.add_argument(
+        "--start_end_file",
+        "--start-end-file",
+        type=str,
+        default=None,
+        help="csv file with the range of each video to keep (videos are not trimmed by default)",
+    )
+
     args = parser.parse_args()
     preprocessor = DataPreparation( args.data_path,
                                     args.labels_path,
                                     args.params_file,
-                                    args.output_path
+                                    args.output_path,
+                                    args.num_workers,
+                                    args.start_end_file
                                 )
     preprocessor.run()
 
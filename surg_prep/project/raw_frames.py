@@ -0,0 +1,74 @@
+import os
+import json
+
+
+RAW_HEADER_FILE = "header.json"
+
+
+def raw_frames_file(out_folder, name):
+    """A util function to get the path of the raw frames array of a video.
+
+    Args:
+        out_folder (str): The frames folder of the video.
+        name (str): The video name.
+
+    Returns:
+        str: The path of the raw frames array file.
+
+    """
+    return os.path.join(out_folder, f"{name}.raw")
+
+
+def write_raw_header(out_folder, name, height, width):
+    """Writes the header of the raw frames array of a video (the "raw" frames layout).
+    The array is a contiguous uint8 array of shape [N, height, width, 3] (RGB), where N
+    is deduced from the array file size.
+
+    The header 'header.json' is of the form:
+        {
+            "array": <array file name>,
+            "dtype": "uint8",
+            "shape": [N, height, width, 3]
+        }
+
+    Args:
+        out_folder (str): The frames folder of the video.
+        name (str): The video name.
+        height (int): The frames height.
+        width (int): The frames width.
+
+    Returns:
+        int: The number of frames N.
+
+    Raises:
+        AssertionError: if the array file size is not a multiple of the frame size.
+
+    """
+    array_file = raw_frames_file(out_folder, name)
+    frame_size = height * width * 3
+    array_size = os.path.getsize(array_file)
+    assert array_size % frame_size == 0, f"{array_file} is not a valid raw frames array"
+
+    header = {
+        "array": os.path.basename(array_file),
+        "dtype": "uint8",
+        "shape": [array_size // frame_size, height, width, 3]
+    }
+    with open(os.path.join(out_folder, RAW_HEADER_FILE), "w") as f:
+        json.dump(header, f)
+
+    return header["shape"][0]
+
+
+def read_raw_header(out_folder):
+    """Reads the header of the raw frames array of a video.
+
+    Args:
+        out_folder (str): The frames folder of the video.
+
+    Returns:
+        dict: The header (described in 'write_raw_header').
+
+    """
+    with open(os.path.join(out_folder, RAW_HEADER_FILE)) as f:
+        return json.load(f)
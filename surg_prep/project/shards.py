@@ -0,0 +1,65 @@
+import os
+import csv
+import tarfile
+
+
+SHARDS_INDEX_FILE = "index.csv"
+
+
+def pack_frames_into_shards(frames_folder, out_folder, shard_prefix, frames_per_shard):
+    """Packs the frames found in a folder into a few large (uncompressed) tar shards, and
+    writes an index file 'index.csv' in the output folder of the form:
+
+    frame_name,     shard,          offset,                         size
+    <frame name>,   <shard name>,   <frame data offset in bytes>,   <frame data size in bytes>
+    ...
+
+    The frames are packed in sorted order, so reading a shard from beginning to end
+    reads its frames sequentially.
+
+    Args:
+        frames_folder (str): The folder containing the frames to be packed.
+        out_folder (str): The folder to write the shards and the index in.
+        shard_prefix (str): The shards file name prefix (shards are named '<prefix>_shard_<i>.tar').
+        frames_per_shard (int): The maximum number of frames per shard.
+
+    Returns:
+        int: The number of packed frames.
+
+    """
+    frames = sorted(os.listdir(frames_folder))
+
+    index = []
+    for shard_id, start in enumerate(range(0, len(frames), frames_per_shard)):
+        shard_name = f"{shard_prefix}_shard_{shard_id:04d}.tar"
+        with tarfile.open(os.path.join(out_folder, shard_name), "w", format=tarfile.USTAR_FORMAT) as tar:
+            for frame in frames[start:start + frames_per_shard]:
+                frame_file = os.path.join(frames_folder, frame)
+                tarinfo = tar.gettarinfo(frame_file, arcname=frame)
+                header_size = len(tarinfo.tobuf(tar.format, tar.encoding, tar.errors))
+                index.append([frame, shard_name, tar.offset + header_size, tarinfo.size])
+                with open(frame_file, "rb") as f:
+                    tar.addfile(tarinfo, f)
+
+    with open(os.path.join(out_folder, SHARDS_INDEX_FILE), "w") as f:
+        writer = csv.writer(f)
+        writer.writerow(["frame_name", "shard", "offset", "size"])
+        writer.writerows(index)
+
+    return len(frames)
+
+
+def read_shards_index(out_folder):
+    """Reads the shards index file of a video.
+
+    Args:
+        out_folder (str): The folder containing the shards of a video.
+
+    Returns:
+        dict: A mapping from each frame name to a tuple (<shard name>, <offset>, <size>).
+
+    """
+    with open(os.path.join(out_folder, SHARDS_INDEX_FILE)) as f:
+        reader = csv.reader(f)
+        next(reader)
+        return {frame: (shard, int(offset), int(size)) for frame, shard, offset, size in reader}
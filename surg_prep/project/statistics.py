@@ -1,12 +1,144 @@
 import os
+import csv
 import yaml
 import argparse
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from utils import get_file_basename, get_file_extention
+from columnar import COLUMNAR_EXTENSION, read_columnar, read_frame_indices, frame_path_index
+
+def labels_statistics(labels, num_labels, frame_indices=None):
+    """Computes the statistics of a video from the array of its labels (see 'video_statistics').
+
+    Args:
+        labels (1D-array[int]): The labels of the frames, sorted by frame.
+        num_labels (int): The number of labels.
+        frame_indices (1D-array[int], optional): The frame index of each label. Segments are broken,
+                                                 with no transition, where the indices are not contiguous
+                                                 (frames with no label were dropped). Defaults to
+                                                 contiguous frames.
+
+    Returns:
+        dict: The statistics of the video (described in 'video_statistics').
+
+    """
+    labels = np.asarray(labels, dtype=np.int64)
+    histogram = np.bincount(labels, minlength=num_labels)
+
+    # gaps between frames that are not adjacent in the video
+    gaps = np.zeros(len(labels), dtype=bool)
+    if frame_indices is not None:
+        frame_indices = np.asarray(frame_indices, dtype=np.int64)
+        gaps[1:] = frame_indices[1:] != frame_indices[:-1] + 1
+
+    # runs of consecutive frames with the same label
+    changes = np.ones(len(labels), dtype=bool)
+    changes[1:] = labels[1:] != labels[:-1]
+    changes |= gaps
+    starts = np.flatnonzero(changes)
+    runs_labels = labels[starts]
+    runs_lengths = np.diff(np.append(starts, len(labels)))
+
+    # only runs of adjacent frames are a transition
+    adjacent = ~gaps[starts[1:]]
+    transitions = np.bincount(runs_labels[:-1][adjacent] * num_labels + runs_labels[1:][adjacent],
+                              minlength=num_labels * num_labels).reshape(num_labels, num_labels)
+    segments = [runs_lengths[runs_labels == label].tolist() for label in range(num_labels)]
+
+    return {"num_frames": len(labels), "histogram": histogram, "transitions": transitions, "segments": segments}
+
+
+def video_statistics(csv_file, num_labels):
+    """Computes the statistics of a video in one pass over its csv file (streamed, not loaded at once).
+    Two rows are adjacent frames if the frame indices encoded in their frame paths are contiguous
+    (see 'columnar.frame_path_index'); frames with no label are dropped by the data preparation,
+    so a gap ends a segment, without a transition. Columnar files ('.npz') are read at once, and
+    their statistics computed with array operations.
+
+    Args:
+        csv_file (str): The path to the csv file of the video.
+        num_labels (int): The number of labels.
+
+    Returns:
+        dict: The statistics of the video of the form:
+            {
+                "num_frames": <number of frames (int)>,
+                "histogram": <number of frames of each label (1D-array[np.int64])>,
+                "transitions": <number of transitions from each label (row) to each other label (column) (2D-array[np.int64])>,
+                "segments": <lengths of the segments (runs of consecutive frames of the same label) of each label (List[List[int]])>
+            }
+
+    """
+    if get_file_extention(csv_file) == COLUMNAR_EXTENSION:
+        return labels_statistics(read_columnar(csv_file, ["label"])["label"], num_labels,
+                                 read_frame_indices(csv_file))
+
+    histogram = np.zeros(num_labels, dtype=np.int64)
+    transitions = np.zeros((num_labels, num_labels), dtype=np.int64)
+    segments = [[] for _ in range(num_labels)]
+
+    num_frames = 0
+    current_label = None
+    current_length = 0
+    previous_index = None
+    with open(csv_file, newline="") as f:
+        reader = csv.reader(f)
+        next(reader, None) # header
+        for row in reader:
+            if not row:
+                continue
+            label = int(row[1])
+            index = frame_path_index(row[0])
+            adjacent = index is None or previous_index is None or index == previous_index + 1
+            previous_index = index
+            num_frames += 1
+            histogram[label] += 1
+            if label == current_label and adjacent:
+                current_length += 1
+                continue
+            if current_label is not None:
+                if adjacent:
+                    transitions[current_label, label] += 1
+                segments[current_label].append(current_length)
+            current_label = label
+            current_length = 1
+
+    if current_label is not None:
+        segments[current_label].append(current_length)
+
+    return {"num_frames": num_frames, "histogram": histogram, "transitions": transitions, "segments": segments}
+
+
+def distribution_summary(values):
+    """A util function to summarize a distribution of values.
+
+    Args:
+        values (List[int]): The values.
+
+    Returns:
+        dict: The count, mean, standard deviation, minimum, quartiles, and maximum of the values.
+
+    """
+    if not len(values):
+        return {"count": 0}
+
+    values = np.asarray(values)
+    p25, median, p75 = np.percentile(values, [25, 50, 75])
+    return {
+        "count": int(len(values)),
+        "mean": float(np.mean(values)),
+        "stddev": float(np.std(values)),
+        "min": int(np.min(values)),
+        "p25": float(p25),
+        "median": float(median),
+        "p75": float(p75),
+        "max": int(np.max(values)),
+    }
 
-from utils import get_file_basename
 
 class Statistics:
-    def __init__(self, data_path, params_file, out_path):
+    def __init__(self, data_path, params_file, out_path, num_workers=None):
         """A class wrapper for calculating the statistics of the prepared dataset.
 
         The following statistics are calculated:
@@ -21,13 +153,41 @@ class Statistics:
                     <video name>: <Number of frames of the video>
                     <video name>: <Number of frames of the video>
                     ...
+            labels_histogram:
+                total:
+                    <label name>: <number of frames of the label>
+                    ...
+                per_video:
+                    <video name>:
+                        <label name>: <number of frames of the label in the video>
+                        ...
+                    ...
+            transitions:
+                total: <total number of phase transitions>
+                per_video:
+                    <video name>: <number of phase transitions in the video>
+                    ...
+                counts:
+                    <label name>:
+                        <label name>: <number of transitions from the first label to the second>
+                        ...
+                    ...
+            segments_lengths:
+                <label name>:
+                    count: <number of segments of the label>
+                    mean, stddev, min, p25, median, p75, max: <statistics of the segments lengths in frames>
+                ...
         '
 
+        A segment is a run of consecutive frames of the same label (see 'video_statistics'). Only non-zero transitions counts are stored.
+
         Args:
             data_path (str): The path to the folder of the prepared data, generated 
                              by the preparation step of the MLCube.
             params_file (str): Configuration file for the data-preparation step.
             out_path (str): Output file to store the statistics.
+            num_workers (int, optional): The number of csv files to process in parallel. Defaults to the
+                                         'num_workers' parameter of the configuration, or 1.
 
         methods:
             run(): executing the statistics calculation task.
@@ -38,28 +198,66 @@ class Statistics:
 
         self.data_path = data_path
         self.out_path = out_path
+        self.num_workers = num_workers or self.params.get("num_workers", 1)
     
-    def run(self):
-        frames_per_video = {}
-        csv_files = os.path.join(self.data_path, "data_csv")
-        for csv_file in os.listdir(csv_files):
-            vid_name = get_file_basename(csv_file)
-            csv_file = os.path.join(csv_files, csv_file)
-            frames_per_video[vid_name] = len(open(csv_file).read().strip().split("\n")) - 1 # header
-        
+    def run(self, csv_files=None):
+        """Calculates the statistics and stores them in 'self.out_path'.
+
+        Args:
+            csv_files (List[str], optional): The paths to the csv (or columnar) files of the videos,
+                                             e.g. from 'check.scan_prepared_data'. Defaults to the
+                                             content of the csv data folder.
+
+        """
+        if csv_files is None:
+            csv_path = os.path.join(self.data_path, "data_csv")
+            csv_files = [os.path.join(csv_path, csv_file) for csv_file in os.listdir(csv_path)]
+        csv_files = sorted(csv_files)
+        vid_names = list(map(get_file_basename, csv_files))
+
+        labels_names = list(self.params["labels"])
+        num_labels = len(labels_names)
+
+        if self.num_workers > 1:
+            with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+                videos_stats = list(executor.map(video_statistics, csv_files, [num_labels]*len(csv_files)))
+        else:
+            videos_stats = [video_statistics(csv_file, num_labels) for csv_file in csv_files]
+
+        frames_per_video = {name: stats["num_frames"] for name, stats in zip(vid_names, videos_stats)}
         as_list = list(frames_per_video.values())
 
+        histogram = sum((stats["histogram"] for stats in videos_stats), np.zeros(num_labels, dtype=np.int64))
+        transitions = sum((stats["transitions"] for stats in videos_stats), np.zeros((num_labels, num_labels), dtype=np.int64))
+        named_counts = lambda counts: {name: int(count) for name, count in zip(labels_names, counts)}
+
         stat = {
                 "num_vids": len(as_list),
                 "num_frames": {
                         "total": sum(as_list),
-                        "mean": float(np.mean(as_list)),
-                        "stddev": float(np.std(as_list)),
+                        "mean": float(np.mean(as_list)) if as_list else 0.0,
+                        "stddev": float(np.std(as_list)) if as_list else 0.0,
                         "per_video": frames_per_video
+                },
+                "labels_histogram": {
+                        "total": named_counts(histogram),
+                        "per_video": {name: named_counts(stats["histogram"]) for name, stats in zip(vid_names, videos_stats)}
+                },
+                "transitions": {
+                        "total": int(transitions.sum()),
+                        "per_video": {name: int(stats["transitions"].sum()) for name, stats in zip(vid_names, videos_stats)},
+                        "counts": {labels_names[i]: {labels_names[j]: int(transitions[i, j])
+                                                     for j in range(num_labels) if transitions[i, j]}
+                                   for i in range(num_labels) if transitions[i].any()}
+                },
+                "segments_lengths": {
+                        name: distribution_summary(sum((stats["segments"][i] for stats in videos_stats), []))
+                        for i, name in enumerate(labels_names)
                 }
             }
         
-        yaml.safe_dump(stat, open(self.out_path, "w"))
+        with open(self.out_path, "w") as f:
+            yaml.safe_dump(stat, f)
 
 
 if __name__ == "__main__":
@@ -90,10 +288,20 @@ if __name__ == "__main__":
     )
 
 
+    parser.add_argument(
+        "--num_workers",
+        "--num-workers",
+        type=int,
+        default=None,
+        help="Number of csv files to process in parallel",
+    )
+
+
     args = parser.parse_args()
     statistics_calculator = Statistics( args.data_path,
                                  args.params_file,
-                                 args.out_path
+                                 args.out_path,
+                                 args.num_workers
                                 )
     statistics_calculator.run()
 
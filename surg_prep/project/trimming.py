@@ -0,0 +1,98 @@
+import csv
+
+import numpy as np
+
+from utils import get_file_basename, LabelsParser
+
+
+def parse_trim_point(value, fps):
+    """Converts a start or end point of the start/end file to a frame_id of the video.
+
+    Args:
+        value (str): A timestamp of form 'hh:mm:ss.ss', a single frame_id integer, or an empty string.
+        fps (Fraction|int): The FPS of the video.
+
+    Returns:
+        int|None: The frame_id, or None for an empty value.
+
+    Raises:
+        ValueError: if the value is neither a timestamp nor a frame_id.
+
+    """
+    value = value.strip()
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        return int(LabelsParser.time_to_id(np.array([value]), fps)[0])
+
+
+def read_start_end_file(start_end_file):
+    """Reads the start/end file of the videos. It expects the following file structure:
+
+    <column-name>,<column-name>,<column-name>
+    <video_name>,<start>,<end>
+    <video_name>,<start>,<end>
+    ...
+
+    Where:
+        The first line is a header,
+        <video_name> is the name of the video file, with or without its extension,
+        <start> and <end> can be timestamps of form 'hh:mm:ss.ss' or frame_id integers of the
+        video (not sampled). An empty <start> is the beginning of the video, an empty <end> its end.
+
+    Args:
+        start_end_file (str): The file name.
+
+    Returns:
+        dict: The (start, end) strings of each video, by video name.
+
+    Raises:
+        AssertionError: if the file structure is not supported, or if a video is listed twice.
+
+    """
+    with open(start_end_file) as f:
+        rows = list(csv.reader(f.read().splitlines()))
+
+    assert all(len(row) == 3 for row in rows), f"Unrecognized file structure of {start_end_file}"
+
+    start_end = {}
+    for video, start, end in rows[1:]:
+        name = get_file_basename(video.strip())
+        assert name not in start_end, f"Video {name} is listed more than once in {start_end_file}"
+        start_end[name] = (start, end)
+    return start_end
+
+
+def trim_frames(start, end, fps, num_frames=None):
+    """Gets the range of frames of a video to keep, from the (start, end) strings of the start/end file.
+
+    Args:
+        start (str): The start point (see 'read_start_end_file').
+        end (str): The end point (see 'read_start_end_file').
+        fps (Fraction|int): The FPS of the video.
+        num_frames (int, optional): The number of frames of the video, if known.
+
+    Returns:
+        A tuple consisting of:
+            int: The first frame_id to keep.
+            int|None: The frame_id following the last frame to keep (None for the end of the video).
+
+    Raises:
+        AssertionError: if a point is invalid, or if the range is empty.
+
+    """
+    try:
+        start_id = parse_trim_point(start, fps) or 0
+        end_id = parse_trim_point(end, fps)
+    except ValueError:
+        raise AssertionError("start and end must be integers as frame IDs or timestamps in the form of 'hh:mm:ss.ss'")
+
+    if num_frames is not None and end_id is not None and end_id >= num_frames:
+        end_id = None
+
+    assert start_id >= 0, f"invalid start {start}"
+    assert end_id is None or end_id > start_id, f"empty range from {start} to {end}"
+    assert num_frames is None or start_id < num_frames, f"start {start} is after the end of the video"
+    return start_id, end_id
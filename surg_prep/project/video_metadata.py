@@ -0,0 +1,192 @@
+import os
+import json
+import subprocess
+from fractions import Fraction
+from concurrent.futures import ThreadPoolExecutor
+
+from utils import file_signature
+
+
+def parse_frame_rate(rate):
+    """A util function to parse a frame rate reported by ffprobe.
+
+    Args:
+        rate (str): A frame rate of the form '<num>/<den>' or '<num>'.
+
+    Returns:
+        Fraction|None: The exact frame rate, or None if the rate is unknown (e.g. '0/0').
+
+    """
+    try:
+        rate = Fraction(rate)
+    except (ValueError, ZeroDivisionError, TypeError):
+        return None
+    return rate if rate > 0 else None
+
+
+def probe_video(filename):
+    """Probes a video file once using ffprobe.
+
+    Args:
+        filename (str): The video file name.
+
+    Returns:
+        dict: The video metadata of the form:
+            {
+                "fps": <exact frame rate (Fraction)>,
+                "num_frames": <number of frames (int)>,
+                "duration": <duration in seconds (float)>,
+                "width": <frame width (int)>,
+                "height": <frame height (int)>,
+                "codec": <video codec name (str)>
+            }
+
+    Raises:
+        AssertionError: if the file could not be probed or has no video stream.
+
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "stream=avg_frame_rate,r_frame_rate,nb_frames,duration,width,height,codec_name:format=duration",
+        "-of", "json", filename
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        error = process.stderr.decode("utf-8", errors="replace").strip()
+        raise AssertionError(f"Could not probe {filename}: {error}")
+
+    probed = json.loads(process.stdout)
+    if not probed.get("streams"):
+        raise AssertionError(f"Could not probe {filename}: no video stream found")
+
+    stream = probed["streams"][0]
+    fps = parse_frame_rate(stream.get("avg_frame_rate")) or parse_frame_rate(stream.get("r_frame_rate"))
+    if fps is None:
+        raise AssertionError(f"Could not probe {filename}: unknown frame rate")
+
+    duration = stream.get("duration", probed.get("format", {}).get("duration"))
+    duration = float(duration) if duration is not None else None
+
+    num_frames = stream.get("nb_frames")
+    if num_frames is not None:
+        num_frames = int(num_frames)
+    elif duration is not None:
+        num_frames = round(duration*fps)
+
+    return {
+        "fps": fps,
+        "num_frames": num_frames,
+        "duration": duration,
+        "width": int(stream["width"]),
+        "height": int(stream["height"]),
+        "codec": stream.get("codec_name"),
+    }
+
+
+def probe_keyframes(filename):
+    """Lists the keyframes of a video using ffprobe. Packets are only demuxed, not decoded,
+    so this is cheap even for long videos.
+
+    Args:
+        filename (str): The video file name.
+
+    Returns:
+        List[float]: The keyframes times in seconds, sorted, relative to the start of the file
+                     (the reference of ffmpeg's input seeking option '-ss'). Empty if the
+                     keyframes could not be probed.
+
+    """
+    cmd = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0", "-show_packets",
+        "-show_entries", "packet=pts_time,flags:format=start_time",
+        "-of", "json", filename
+    ]
+    process = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        return []
+
+    try:
+        probed = json.loads(process.stdout)
+        start_time = float(probed.get("format", {}).get("start_time", 0))
+        return sorted(float(packet["pts_time"]) - start_time for packet in probed.get("packets", [])
+                      if "K" in packet.get("flags", "") and "pts_time" in packet)
+    except (ValueError, TypeError):
+        return []
+
+
+class VideoMetadataCache:
+    def __init__(self, cache_file):
+        """An on-disk cache of videos metadata. Each entry is keyed by the video path and
+        is only valid as long as the size and the modification time of the video are unchanged.
+
+        Args:
+            cache_file (str): The json file to store the cache in.
+
+        methods:
+            get(): getting the metadata of a list of videos, probing only the videos not found in the cache.
+            save(): storing the cache on disk.
+
+        """
+        self.cache_file = cache_file
+        self.entries = {}
+
+        if os.path.exists(cache_file):
+            try:
+                with open(cache_file) as f:
+                    self.entries = json.load(f)
+            except ValueError:
+                print(f"Warning: videos metadata cache {cache_file} is corrupted. It will be rebuilt.")
+
+    def get(self, filenames, max_workers=None):
+        """Gets the metadata of the given videos. Videos that are not cached (or have changed)
+        are probed concurrently and the cache is updated and saved.
+
+        Args:
+            filenames (List[str]): The video file names.
+            max_workers (int, optional): Maximum number of concurrent probes.
+
+        Returns:
+            A tuple consisting of:
+                dict: A mapping from each successfully probed video to its metadata (described in 'probe_video').
+                dict: A mapping from each video that could not be probed to the error message.
+
+        """
+        metadata = {}
+        errors = {}
+        to_probe = []
+        for filename in filenames:
+            key = os.path.abspath(filename)
+            entry = self.entries.get(key)
+            if entry is not None and entry["signature"] == file_signature(filename):
+                metadata[filename] = dict(entry["metadata"], fps=Fraction(entry["metadata"]["fps"]))
+            else:
+                to_probe.append(filename)
+
+        if not to_probe:
+            return metadata, errors
+
+        print(f"Probing {len(to_probe)} videos ({len(filenames) - len(to_probe)} found in cache)")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {filename: executor.submit(probe_video, filename) for filename in to_probe}
+            for filename, future in futures.items():
+                try:
+                    metadata[filename] = future.result()
+                except AssertionError as e:
+                    errors[filename] = str(e)
+                    continue
+
+                self.entries[os.path.abspath(filename)] = {
+                    "signature": file_signature(filename),
+                    "metadata": dict(metadata[filename], fps=str(metadata[filename]["fps"]))
+                }
+
+        self.save()
+        return metadata, errors
+
+    def save(self):
+        cache_dir = os.path.dirname(self.cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        with open(self.cache_file, "w") as f:
+            json.dump(self.entries, f, indent=4)
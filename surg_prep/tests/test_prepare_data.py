@@ -0,0 +1,63 @@
+import os
+import sys
+import shutil
+import hashlib
+import subprocess
+from fractions import Fraction
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "project"))
+
+import prepare_data
+
+
+VIDEO_FPS = Fraction(30000, 1001)
+GOP_SIZE = 48
+
+pytestmark = pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg is not available")
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    """A 40 s video at a non-integer frame rate, with a keyframe every GOP_SIZE frames."""
+    path = str(tmp_path_factory.mktemp("videos") / "video.mp4")
+    subprocess.run(["ffmpeg", "-loglevel", "error", "-nostdin", "-f", "lavfi",
+                    "-i", f"testsrc2=size=160x120:rate={VIDEO_FPS}:duration=40",
+                    "-c:v", "libx264", "-g", str(GOP_SIZE), "-sc_threshold", "0", "-pix_fmt", "yuv420p", path],
+                   check=True)
+    return path
+
+
+def extract(video, folder, num_segments, trim):
+    os.makedirs(folder)
+    params = {"fps": 25, "scale": [80, 60], "extraction_segments": num_segments}
+    _, error, num_frames = prepare_data.extract_video_frames(video, str(folder), params, trim)
+    assert error is None
+    digests = [hashlib.md5(open(os.path.join(folder, name), "rb").read()).hexdigest()
+               for name in sorted(os.listdir(folder))]
+    return num_frames, digests
+
+
+@pytest.mark.parametrize("trim", [
+    (Fraction(182) / VIDEO_FPS, Fraction(1025) / VIDEO_FPS),
+    (Fraction(183) / VIDEO_FPS, Fraction(900) / VIDEO_FPS),
+    (Fraction(0), Fraction(700) / VIDEO_FPS),
+    (Fraction(300) / VIDEO_FPS, None),
+    (Fraction("7.3"), Fraction("30.1")),
+])
+@pytest.mark.parametrize("num_segments", [3, 5])
+def test_trimmed_segments_match_sequential_extraction(video, tmp_path, monkeypatch, trim, num_segments):
+    # the keyframes are known from the GOP size (ffprobe is not needed)
+    keyframes = [float(i * GOP_SIZE / VIDEO_FPS) for i in range(int(40 * VIDEO_FPS) // GOP_SIZE + 1)]
+    monkeypatch.setattr(prepare_data, "probe_keyframes", lambda vid_path: keyframes)
+
+    assert len(prepare_data.extraction_segments(video, 25, num_segments, trim)) > 1
+
+    sequential = extract(video, tmp_path / "sequential", 1, trim)
+    segmented = extract(video, tmp_path / "segmented", num_segments, trim)
+
+    assert segmented == sequential
+    start, end = trim
+    if end is not None:
+        assert sequential[0] == int((end - start) * 25)